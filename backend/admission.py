@@ -0,0 +1,200 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+# Priority classes (lower is served first)
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+# Finish tags older than the virtual clock carry no history, so they can be dropped
+_PRUNE_TENANTS_AT = 10000
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted within the queueing SLO"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("tenant", "future", "enqueued_at", "cancelled")
+
+    def __init__(self, tenant: str, future: asyncio.Future):
+        self.tenant = tenant
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.cancelled = False
+
+
+class AdmissionController:
+    """
+    Concurrency limiter with a weighted fair queue per tenant.
+
+    Uses start-time fair queueing: each request is tagged with
+    max(virtual_time, tenant's last finish tag) and its tenant's finish tag advances
+    by 1 / weight, so a tenant with a deep backlog cannot push other tenants back.
+    High-priority requests are always dispatched before normal ones.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        queue_slo_seconds: float,
+        max_queue: int,
+        tenant_weights: Optional[Dict[str, float]] = None,
+        default_weight: float = 1.0,
+        window: int = 1024
+    ):
+        self.max_concurrent = max_concurrent
+        self.queue_slo_seconds = queue_slo_seconds
+        self.max_queue = max_queue
+        # A zero weight would divide by zero in _tag and a negative one would move finish tags backwards
+        for tenant, weight in {**(tenant_weights or {}), "(default)": default_weight}.items():
+            if isinstance(weight, bool) or not (isinstance(weight, (int, float)) and 0 < weight < math.inf):
+                raise ValueError(f"Admission weight for tenant {tenant!r} must be a positive number, got {weight!r}")
+        self.tenant_weights = {tenant: float(weight) for tenant, weight in (tenant_weights or {}).items()}
+        self.default_weight = float(default_weight)
+
+        self._in_flight = 0
+        self._queued = 0
+        self._queued_by_tenant: Dict[str, int] = {}
+        self._heap: List[Tuple[int, float, int, _Waiter]] = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._finish_tags: Dict[str, float] = {}
+        self._service_time = 0.0  # EWMA seconds a slot is held (0 until first release)
+
+        self._wait_times: Deque[float] = deque(maxlen=window)
+        self._admitted = 0
+        self._rejected = 0
+
+    def _tag(self, tenant: str) -> float:
+        """Assign the request's start tag and advance the tenant's finish tag"""
+        if len(self._finish_tags) > _PRUNE_TENANTS_AT:
+            self._finish_tags = {
+                name: tag for name, tag in self._finish_tags.items() if tag > self._virtual_time
+            }
+        start = max(self._virtual_time, self._finish_tags.get(tenant, 0.0))
+        weight = self.tenant_weights.get(tenant, self.default_weight)
+        self._finish_tags[tenant] = start + 1.0 / weight
+        return start
+
+    def _estimated_wait(self, ahead: int) -> float:
+        return (ahead + 1) / self.max_concurrent * self._service_time
+
+    def _reject(self, reason: str, estimated_wait: float):
+        self._rejected += 1
+        raise AdmissionRejected(reason, retry_after=max(1, math.ceil(estimated_wait)))
+
+    def _dequeued(self, waiter: _Waiter):
+        self._queued -= 1
+        remaining = self._queued_by_tenant[waiter.tenant] - 1
+        if remaining:
+            self._queued_by_tenant[waiter.tenant] = remaining
+        else:
+            del self._queued_by_tenant[waiter.tenant]
+
+    def _dispatch(self):
+        while self._in_flight < self.max_concurrent and self._heap:
+            _, start, _, waiter = heapq.heappop(self._heap)
+            if waiter.cancelled:
+                continue
+            self._dequeued(waiter)
+            self._virtual_time = max(self._virtual_time, start)
+            self._in_flight += 1
+            waiter.future.set_result(None)
+
+    async def acquire(self, tenant: str, priority: int = PRIORITY_NORMAL) -> float:
+        """Wait for a slot; returns the monotonic time it was granted"""
+        if self._in_flight < self.max_concurrent and not self._queued:
+            start = self._tag(tenant)
+            self._virtual_time = max(self._virtual_time, start)
+            self._in_flight += 1
+            self._record_admission(0.0)
+            return time.monotonic()
+
+        estimated_wait = self._estimated_wait(self._queued)
+        if self._queued >= self.max_queue:
+            self._reject("Admission queue is full", estimated_wait)
+        if estimated_wait > self.queue_slo_seconds:
+            self._reject("Estimated queue wait exceeds SLO", estimated_wait)
+
+        start = self._tag(tenant)
+        waiter = _Waiter(tenant, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, (priority, start, next(self._sequence), waiter))
+        self._queued += 1
+        self._queued_by_tenant[tenant] = self._queued_by_tenant.get(tenant, 0) + 1
+
+        try:
+            await asyncio.wait({waiter.future}, timeout=self.queue_slo_seconds)
+        except BaseException:
+            # Caller was cancelled while queued: hand back a slot that was already granted
+            if waiter.future.done():
+                self._free_slot()
+            else:
+                waiter.cancelled = True
+                self._dequeued(waiter)
+            raise
+
+        if not waiter.future.done():
+            waiter.cancelled = True
+            self._dequeued(waiter)
+            self._reject("Queue wait exceeded SLO", self._estimated_wait(self._queued))
+
+        self._record_admission(time.monotonic() - waiter.enqueued_at)
+        return time.monotonic()
+
+    def release(self, granted_at: float):
+        """Return a slot and wake the next queued request"""
+        held = time.monotonic() - granted_at
+        if self._service_time:
+            self._service_time = 0.9 * self._service_time + 0.1 * held
+        else:
+            self._service_time = held
+        self._free_slot()
+
+    def _free_slot(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _record_admission(self, wait: float):
+        self._admitted += 1
+        self._wait_times.append(wait)
+
+    @asynccontextmanager
+    async def admit(self, tenant: str, priority: int = PRIORITY_NORMAL):
+        granted_at = await self.acquire(tenant, priority)
+        try:
+            yield
+        finally:
+            self.release(granted_at)
+
+    def stats(self) -> Dict:
+        """Queue depth and recent wait-time distribution"""
+        waits = sorted(self._wait_times)
+
+        def percentile(fraction: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(fraction * len(waits)))]
+
+        return {
+            "in_flight": self._in_flight,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": self._queued,
+            "queue_depth_by_tenant": dict(self._queued_by_tenant),
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "wait_seconds_p50": percentile(0.50),
+            "wait_seconds_p95": percentile(0.95),
+            "wait_seconds_p99": percentile(0.99),
+            "service_seconds_ewma": self._service_time,
+        }
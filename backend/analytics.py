@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import ChatSession, Message, Escalation, MetricRollup, MessageRole
+
+# Rollup metrics
+METRIC_SESSIONS = "sessions"
+METRIC_MESSAGES = "messages"
+METRIC_CONFIDENCE = "confidence"
+METRIC_ESCALATIONS = "escalations"
+
+# Bucket widths maintained for every metric
+GRANULARITIES = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+}
+
+MAX_BUCKETS = 1440
+
+# Rows per INSERT during rebuild (keeps bound parameters under SQLite's limit)
+INSERT_CHUNK = 150
+
+# (metric, value, dimension, timestamp)
+MetricEvent = Tuple[str, Optional[float], str, Optional[datetime]]
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Truncate a timestamp to the start of its rollup bucket"""
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _fold_events(rows: Dict[Tuple, Dict], events: List[MetricEvent]):
+    """Fold metric events into one row per (metric, granularity, bucket, dimension)"""
+    now = datetime.utcnow()
+    for metric, value, dimension, timestamp in events:
+        timestamp = timestamp or now
+        for granularity in GRANULARITIES:
+            key = (metric, granularity, bucket_start(timestamp, granularity), dimension)
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = {
+                    "metric": metric,
+                    "granularity": granularity,
+                    "bucket_start": key[2],
+                    "dimension": dimension,
+                    "count": 0,
+                    "total": 0.0,
+                }
+            row["count"] += 1
+            row["total"] += value or 0.0
+
+
+async def record_metrics(db: AsyncSession, events: List[MetricEvent]):
+    """
+    Increment rollup buckets for a batch of events inside the caller's transaction.
+    Uses a single multi-row upsert so a chat write costs one extra statement.
+    """
+    rows: Dict[Tuple, Dict] = {}
+    _fold_events(rows, events)
+    if not rows:
+        return
+
+    stmt = sqlite_insert(MetricRollup).values(list(rows.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["metric", "granularity", "bucket_start", "dimension"],
+        set_={
+            "count": MetricRollup.count + stmt.excluded.count,
+            "total": MetricRollup.total + stmt.excluded.total,
+        }
+    )
+    await db.execute(stmt)
+
+
+def message_events(role: MessageRole, confidence_score: Optional[float] = None, timestamp: Optional[datetime] = None) -> List[MetricEvent]:
+    """Metric events produced by storing a single message"""
+    events: List[MetricEvent] = [(METRIC_MESSAGES, None, role.value, timestamp)]
+    if confidence_score is not None:
+        events.append((METRIC_CONFIDENCE, confidence_score, "", timestamp))
+    return events
+
+
+async def get_series(
+    db: AsyncSession,
+    metric: str,
+    granularity: str,
+    buckets: int,
+    until: Optional[datetime] = None
+) -> List[MetricRollup]:
+    """
+    Fetch the last `buckets` rollup rows for a metric.
+    Reads a bounded index range, so cost does not depend on raw table size.
+    """
+    buckets = max(1, min(buckets, MAX_BUCKETS))
+    until = until or datetime.utcnow()
+    since = bucket_start(until, granularity) - GRANULARITIES[granularity] * (buckets - 1)
+
+    result = await db.execute(
+        select(MetricRollup)
+        .where(
+            MetricRollup.metric == metric,
+            MetricRollup.granularity == granularity,
+            MetricRollup.bucket_start >= since,
+            MetricRollup.bucket_start <= until
+        )
+        .order_by(MetricRollup.bucket_start, MetricRollup.dimension)
+    )
+    return list(result.scalars().all())
+
+
+async def rebuild_rollups(db: AsyncSession, batch_size: int = 5000):
+    """Recompute all rollups from the raw tables (offline backfill)"""
+    await db.execute(delete(MetricRollup))
+
+    sources = [
+        (select(ChatSession.created_at), lambda row: (METRIC_SESSIONS, None, "", row[0])),
+        (select(Escalation.escalated_at, Escalation.trigger_type),
+         lambda row: (METRIC_ESCALATIONS, None, row[1].value, row[0])),
+    ]
+
+    rows: Dict[Tuple, Dict] = {}
+    for statement, to_event in sources:
+        stream = await db.stream(statement.execution_options(yield_per=batch_size))
+        async for row in stream:
+            _fold_events(rows, [to_event(row)])
+
+    stream = await db.stream(
+        select(Message.timestamp, Message.role, Message.confidence_score)
+        .execution_options(yield_per=batch_size)
+    )
+    async for timestamp, role, confidence_score in stream:
+        _fold_events(rows, message_events(role, confidence_score, timestamp))
+
+    values = list(rows.values())
+    for start in range(0, len(values), INSERT_CHUNK):
+        await db.execute(sqlite_insert(MetricRollup).values(values[start:start + INSERT_CHUNK]))
+    await db.commit()
+    return len(rows)
+
+
+async def _main():
+    from database import async_session_factory, init_db, close_db
+
+    parser = argparse.ArgumentParser(description="Maintain analytics rollup tables")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: recompute rollups from raw tables")
+    parser.parse_args()
+
+    await init_db()
+    async with async_session_factory() as db:
+        count = await rebuild_rollups(db)
+    await close_db()
+    print(f"[OK] Rebuilt {count} rollup buckets")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
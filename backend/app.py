@@ -1,18 +1,26 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
+from contextlib import nullcontext
 import uuid
 
 from config import get_settings
-from database import get_db, init_db, close_db
+from database import get_db, init_db, close_db, async_session_factory
 from models import ChatSession, Message, Escalation, SessionStatus, MessageRole, EscalationTrigger
 from llm_service import LLMService
+import analytics
+import message_store
+from write_behind import WriteBehindQueue, merge_transcript
+from serialization import FastJSONResponse
+from tracing import TraceRequestsMiddleware, tracer
+from memory import accountant
+from admission import AdmissionController, AdmissionRejected, PRIORITY_HIGH, PRIORITY_NORMAL
 
 settings = get_settings()
 app = FastAPI(title=settings.APP_NAME, debug=settings.DEBUG)
@@ -26,6 +34,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Root span per request; continues a W3C traceparent from the caller when present
+app.add_middleware(TraceRequestsMiddleware)
+
 # Mount static files (frontend)
 import os
 frontend_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "frontend")
@@ -35,6 +46,34 @@ if os.path.exists(frontend_path):
 # Initialize LLM Service
 llm_service = LLMService()
 
+# Admission control for provider-bound chat requests
+admission_controller = AdmissionController(
+    max_concurrent=settings.ADMISSION_MAX_CONCURRENT,
+    queue_slo_seconds=settings.ADMISSION_QUEUE_SLO_SECONDS,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    tenant_weights=settings.ADMISSION_TENANT_WEIGHTS
+)
+
+# Optional write-behind queue for chat messages (started with the app)
+write_behind_queue = WriteBehindQueue(
+    async_session_factory,
+    log_path=settings.WRITE_BEHIND_LOG_PATH,
+    fsync=settings.WRITE_BEHIND_FSYNC,
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL_MS / 1000,
+    max_pending=settings.WRITE_BEHIND_MAX_PENDING,
+    compact_bytes=settings.WRITE_BEHIND_LOG_COMPACT_BYTES
+) if settings.WRITE_BEHIND_ENABLED else None
+if write_behind_queue is not None:
+    accountant.register("write_behind_buffer", lambda: write_behind_queue.pending_bytes)
+
+async def load_transcript(db: AsyncSession, session_id: str):
+    """Stored transcript plus any of the session's messages still in the write-behind queue"""
+    if write_behind_queue is None:
+        return await message_store.fetch_transcript(db, session_id)
+    pending = write_behind_queue.snapshot(session_id)
+    return merge_transcript(await message_store.fetch_transcript(db, session_id), pending)
+
 # Pydantic Models
 class CreateSessionRequest(BaseModel):
     user_id: Optional[str] = None
@@ -76,11 +115,44 @@ class EscalateResponse(BaseModel):
     summary: str
     escalated_at: datetime
 
+class CountBucket(BaseModel):
+    bucket_start: datetime
+    count: int
+
+class ConfidenceBucket(BaseModel):
+    bucket_start: datetime
+    count: int
+    average_confidence: Optional[float]
+
+class ConfidenceAnalyticsResponse(BaseModel):
+    granularity: str
+    average_confidence: Optional[float]
+    buckets: List[ConfidenceBucket]
+
+class EscalationRate(BaseModel):
+    count: int
+    rate: Optional[float]
+
+class EscalationAnalyticsResponse(BaseModel):
+    granularity: str
+    sessions: int
+    triggers: Dict[str, EscalationRate]
+    buckets: Dict[str, List[CountBucket]]
+
+class SessionAnalyticsResponse(BaseModel):
+    granularity: str
+    total: int
+    buckets: List[CountBucket]
+
 # Startup and Shutdown Events
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
     await init_db()
+    async with async_session_factory() as db:
+        await message_store.load_dictionaries(db)
+    if write_behind_queue is not None:
+        await write_behind_queue.start()
     print("[OK] Database initialized successfully")
     print(f"[OK] {settings.APP_NAME} is running!")
     
@@ -100,6 +172,8 @@ async def startup_event():
         else:
             print("[INFO] No OpenAI API key configured - using mock responses for demo")
             print("   To enable AI responses, add your OpenAI API key to the .env file")
+    elif ai_provider in ("record", "replay"):
+        print(f"[INFO] Provider {ai_provider} mode for {settings.RECORDING_PROVIDER} ({settings.RECORDING_PATH})")
     else:
         print("[INFO] Using mock responses for demo mode")
         print("   To enable AI responses, configure AI_PROVIDER and add API key to the .env file")
@@ -107,6 +181,10 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
+    if write_behind_queue is not None:
+        await write_behind_queue.stop()
+    if llm_service.recorder is not None:
+        llm_service.recorder.close()
     await close_db()
     print("Database connections closed")
 
@@ -121,8 +199,25 @@ async def root():
 
 @app.get("/api/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "ok", "message": "AI Customer Support Bot API", "version": "1.0"}
+    """Health check endpoint, with this worker's memory footprint by component"""
+    return {
+        "status": "ok",
+        "message": "AI Customer Support Bot API",
+        "version": "1.0",
+        "memory": accountant.snapshot()
+    }
+
+@app.get("/api/admission/stats")
+async def admission_stats():
+    """Admission queue depth and wait-time metrics for this worker"""
+    return {"enabled": settings.ADMISSION_ENABLED, **admission_controller.stats()}
+
+@app.get("/api/write-behind/stats")
+async def write_behind_stats():
+    """Write-behind queue depth and flush counters for this worker"""
+    if write_behind_queue is None:
+        return {"enabled": False}
+    return {"enabled": True, **write_behind_queue.stats()}
 
 @app.post("/api/chat/create", response_model=CreateSessionResponse, status_code=status.HTTP_201_CREATED)
 async def create_chat_session(
@@ -139,7 +234,9 @@ async def create_chat_session(
     )
     
     db.add(new_session)
-    await db.commit()
+    await analytics.record_metrics(db, [(analytics.METRIC_SESSIONS, None, "", None)])
+    with tracer.span("db.commit"):
+        await db.commit()
     await db.refresh(new_session)
     
     return CreateSessionResponse(
@@ -168,45 +265,88 @@ async def send_message(
         raise HTTPException(status_code=400, detail="Session is not active")
     
     # Get conversation history
-    messages_result = await db.execute(
-        select(Message)
-        .where(Message.session_id == request.session_id)
-        .order_by(Message.timestamp)
-    )
-    messages = messages_result.scalars().all()
+    transcript = await load_transcript(db, request.session_id)
     
     conversation_history = [
-        {"role": msg.role.value, "content": msg.content}
-        for msg in messages
+        {"role": role.value, "content": content}
+        for role, content, _, _ in transcript
     ]
     
-    # Save user message
-    user_message = Message(
-        session_id=request.session_id,
-        role=MessageRole.USER,
-        content=request.message
-    )
-    db.add(user_message)
+    received_at = datetime.utcnow()
     
     # Generate AI response
-    response_text, confidence_score, should_escalate = await llm_service.generate_response(
-        request.message,
-        conversation_history
-    )
+    with tracer.span("chat.generate_response", **{"llm.provider": llm_service.ai_provider}) as span:
+        if settings.ADMISSION_ENABLED:
+            # Escalation-bound and long-running sessions jump the fair queue
+            is_priority = (
+                llm_service._check_escalation_keywords(request.message)
+                or len(conversation_history) >= settings.ADMISSION_LONG_SESSION_MESSAGES
+            )
+            try:
+                async with admission_controller.admit(
+                    session.user_id or "anonymous",
+                    PRIORITY_HIGH if is_priority else PRIORITY_NORMAL
+                ):
+                    response_text, confidence_score, should_escalate = await llm_service.generate_response(
+                        request.message,
+                        conversation_history
+                    )
+            except AdmissionRejected as rejection:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail=rejection.reason,
+                    headers={"Retry-After": str(rejection.retry_after)}
+                )
+        else:
+            response_text, confidence_score, should_escalate = await llm_service.generate_response(
+                request.message,
+                conversation_history
+            )
+        span.set_attribute("llm.confidence_score", confidence_score)
+        span.set_attribute("llm.should_escalate", should_escalate)
+    
+    # Queue both messages; the background flusher persists them and bumps updated_at
+    if write_behind_queue is not None:
+        _, queued_reply = await write_behind_queue.append(request.session_id, [
+            (MessageRole.USER, request.message, None, received_at),
+            (MessageRole.ASSISTANT, response_text, confidence_score, datetime.utcnow()),
+        ])
+        return SendMessageResponse(
+            session_id=request.session_id,
+            response=response_text,
+            confidence_score=confidence_score,
+            should_escalate=should_escalate,
+            timestamp=queued_reply.timestamp
+        )
     
-    # Save assistant message
+    # Save user and assistant messages
+    db.add(Message(
+        session_id=request.session_id,
+        role=MessageRole.USER,
+        content=request.message,
+        timestamp=received_at
+    ))
     assistant_message = Message(
         session_id=request.session_id,
         role=MessageRole.ASSISTANT,
         content=response_text,
         confidence_score=confidence_score
     )
+    await message_store.dedupe_content(db, assistant_message)
     db.add(assistant_message)
     
     # Update session timestamp
     session.updated_at = datetime.utcnow()
     
-    await db.commit()
+    # Maintain analytics rollups in the same transaction
+    await analytics.record_metrics(
+        db,
+        analytics.message_events(MessageRole.USER, timestamp=received_at)
+        + analytics.message_events(MessageRole.ASSISTANT, confidence_score)
+    )
+    
+    with tracer.span("db.commit"):
+        await db.commit()
     
     return SendMessageResponse(
         session_id=request.session_id,
@@ -221,40 +361,37 @@ async def get_conversation_history(
     session_id: str,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get conversation history for a session"""
+    """
+    Get conversation history for a session.
+    Rows are selected as plain columns and encoded straight to JSON; the response_model
+    documents the shape but is not re-validated for every message.
+    """
     
     # Fetch session
     result = await db.execute(
-        select(ChatSession).where(ChatSession.session_id == session_id)
+        select(ChatSession.session_id, ChatSession.status).where(ChatSession.session_id == session_id)
     )
-    session = result.scalar_one_or_none()
+    session = result.first()
     
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
     # Get messages
-    messages_result = await db.execute(
-        select(Message)
-        .where(Message.session_id == session_id)
-        .order_by(Message.timestamp)
-    )
-    messages = messages_result.scalars().all()
-    
-    message_list = [
-        MessageResponse(
-            role=msg.role.value,
-            content=msg.content,
-            confidence_score=msg.confidence_score,
-            timestamp=msg.timestamp
-        )
-        for msg in messages
-    ]
-    
-    return ConversationHistoryResponse(
-        session_id=session.session_id,
-        status=session.status.value,
-        messages=message_list
-    )
+    transcript = await load_transcript(db, session_id)
+    
+    return FastJSONResponse({
+        "session_id": session.session_id,
+        "status": session.status.value,
+        "messages": [
+            {
+                "role": role.value,
+                "content": content,
+                "confidence_score": confidence_score,
+                "timestamp": timestamp
+            }
+            for role, content, confidence_score, timestamp in transcript
+        ]
+    })
 
 @app.post("/api/chat/escalate", response_model=EscalateResponse)
 async def escalate_to_human(
@@ -273,16 +410,11 @@ async def escalate_to_human(
         raise HTTPException(status_code=404, detail="Session not found")
     
     # Get conversation history for summary
-    messages_result = await db.execute(
-        select(Message)
-        .where(Message.session_id == request.session_id)
-        .order_by(Message.timestamp)
-    )
-    messages = messages_result.scalars().all()
+    transcript = await load_transcript(db, request.session_id)
     
     conversation_history = [
-        {"role": msg.role.value, "content": msg.content}
-        for msg in messages
+        {"role": role.value, "content": content}
+        for role, content, _, _ in transcript
     ]
     
     # Generate conversation summary
@@ -300,7 +432,12 @@ async def escalate_to_human(
     session.status = SessionStatus.ESCALATED
     session.updated_at = datetime.utcnow()
     
-    await db.commit()
+    await analytics.record_metrics(
+        db, [(analytics.METRIC_ESCALATIONS, None, EscalationTrigger.CUSTOMER_DRIVEN.value, None)]
+    )
+    
+    with tracer.span("db.commit"):
+        await db.commit()
     await db.refresh(escalation)
     
     return EscalateResponse(
@@ -317,19 +454,101 @@ async def delete_session(
 ):
     """Delete a chat session and all related data"""
     
-    result = await db.execute(
-        select(ChatSession).where(ChatSession.session_id == session_id)
-    )
-    session = result.scalar_one_or_none()
-    
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    await db.delete(session)
-    await db.commit()
+    # Hold off write-behind flushes for the whole delete, so none commits rows for the session
+    # in between; taken before the first query so a waiting request holds no pooled connection
+    paused = write_behind_queue.paused() if write_behind_queue is not None else nullcontext()
+    async with paused:
+        result = await db.execute(
+            select(ChatSession).where(ChatSession.session_id == session_id)
+        )
+        session = result.scalar_one_or_none()
+        
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        
+        if write_behind_queue is not None:
+            write_behind_queue.discard(session_id)
+        await db.delete(session)
+        with tracer.span("db.commit"):
+            await db.commit()
     
     return None
 
+# Analytics Endpoints (served from pre-aggregated rollups)
+GRANULARITY_PATTERN = "^(minute|hour)$"
+
+@app.get("/api/analytics/confidence", response_model=ConfidenceAnalyticsResponse)
+async def confidence_analytics(
+    granularity: str = Query("hour", pattern=GRANULARITY_PATTERN),
+    buckets: int = Query(24, ge=1, le=analytics.MAX_BUCKETS),
+    db: AsyncSession = Depends(get_db)
+):
+    """Average assistant confidence score per time bucket"""
+    rows = await analytics.get_series(db, analytics.METRIC_CONFIDENCE, granularity, buckets)
+    
+    count = sum(row.count for row in rows)
+    total = sum(row.total for row in rows)
+    
+    return ConfidenceAnalyticsResponse(
+        granularity=granularity,
+        average_confidence=total / count if count else None,
+        buckets=[
+            ConfidenceBucket(
+                bucket_start=row.bucket_start,
+                count=row.count,
+                average_confidence=row.total / row.count if row.count else None
+            )
+            for row in rows
+        ]
+    )
+
+@app.get("/api/analytics/escalations", response_model=EscalationAnalyticsResponse)
+async def escalation_analytics(
+    granularity: str = Query("hour", pattern=GRANULARITY_PATTERN),
+    buckets: int = Query(24, ge=1, le=analytics.MAX_BUCKETS),
+    db: AsyncSession = Depends(get_db)
+):
+    """Escalation counts and rate (per created session) by trigger type"""
+    session_rows = await analytics.get_series(db, analytics.METRIC_SESSIONS, granularity, buckets)
+    escalation_rows = await analytics.get_series(db, analytics.METRIC_ESCALATIONS, granularity, buckets)
+    
+    sessions = sum(row.count for row in session_rows)
+    triggers = {}
+    series = {}
+    for trigger in EscalationTrigger:
+        trigger_rows = [row for row in escalation_rows if row.dimension == trigger.value]
+        count = sum(row.count for row in trigger_rows)
+        triggers[trigger.value] = EscalationRate(
+            count=count,
+            rate=count / sessions if sessions else None
+        )
+        series[trigger.value] = [
+            CountBucket(bucket_start=row.bucket_start, count=row.count)
+            for row in trigger_rows
+        ]
+    
+    return EscalationAnalyticsResponse(
+        granularity=granularity,
+        sessions=sessions,
+        triggers=triggers,
+        buckets=series
+    )
+
+@app.get("/api/analytics/sessions", response_model=SessionAnalyticsResponse)
+async def session_analytics(
+    granularity: str = Query("hour", pattern=GRANULARITY_PATTERN),
+    buckets: int = Query(24, ge=1, le=analytics.MAX_BUCKETS),
+    db: AsyncSession = Depends(get_db)
+):
+    """Session volume over time"""
+    rows = await analytics.get_series(db, analytics.METRIC_SESSIONS, granularity, buckets)
+    
+    return SessionAnalyticsResponse(
+        granularity=granularity,
+        total=sum(row.count for row in rows),
+        buckets=[CountBucket(bucket_start=row.bucket_start, count=row.count) for row in rows]
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
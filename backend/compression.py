@@ -0,0 +1,201 @@
+import enum
+import struct
+import sys
+import zlib
+from typing import Dict, Iterable, Optional, Type
+
+from sqlalchemy.types import TypeDecorator, String, Text
+
+from config import get_settings
+from memory import BoundedCache
+
+settings = get_settings()
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Storage modes
+STORAGE_PLAIN = "plain"
+STORAGE_COMPACT = "compact"
+
+# Codec ids written in the first byte of a compressed value
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+# codec (1 byte) + dictionary id (4 bytes, 0 = no dictionary)
+_HEADER = struct.Struct(">BI")
+
+# zlib only looks back 32KB, so a larger preset dictionary is wasted
+MAX_DICTIONARY_BYTES = 32 * 1024
+
+_storage_mode = settings.MESSAGE_STORAGE_MODE.lower()
+_dictionaries: Dict[int, bytes] = {}
+_zstd_dictionaries: Dict[int, object] = {}
+_zstd_compressors: Dict[int, object] = {}
+_zstd_decompressors: Dict[int, object] = {}
+_active_dictionary_id = 0
+
+
+def get_storage_mode() -> str:
+    return _storage_mode
+
+
+def set_storage_mode(mode: str):
+    """Override the configured storage mode (used by the migration tool)"""
+    global _storage_mode
+    if mode not in (STORAGE_PLAIN, STORAGE_COMPACT):
+        raise ValueError(f"Unknown storage mode: {mode}")
+    _storage_mode = mode
+
+
+def is_compact() -> bool:
+    return _storage_mode == STORAGE_COMPACT
+
+
+def dictionary_id(data: bytes) -> int:
+    """Stable id for a dictionary, derived from its content"""
+    return zlib.crc32(data) or 1
+
+
+def build_dictionary(samples: Iterable[str]) -> bytes:
+    """
+    Build a raw-content dictionary from representative message bodies.
+    Later bytes are cheaper to reference, so samples are appended in order of importance.
+    """
+    data = b"".join(sample.encode("utf-8") for sample in samples)
+    return data[-MAX_DICTIONARY_BYTES:]
+
+
+def register_dictionary(data: bytes, active: bool = True) -> int:
+    """Make a dictionary available for decoding (and optionally for encoding)"""
+    global _active_dictionary_id
+    dict_id = dictionary_id(data)
+    _dictionaries[dict_id] = data
+    if zstandard is not None:
+        _zstd_dictionaries[dict_id] = zstandard.ZstdCompressionDict(
+            data, dict_type=zstandard.DICT_TYPE_RAWCONTENT
+        )
+    if active:
+        _active_dictionary_id = dict_id
+    return dict_id
+
+
+def compress_text(text: str) -> bytes:
+    """Compress text with the active shared dictionary (zstd if available, else zlib)"""
+    raw = text.encode("utf-8")
+    dict_id = _active_dictionary_id
+
+    if zstandard is not None:
+        compressor = _zstd_compressors.get(dict_id)
+        if compressor is None:
+            compressor = _zstd_compressors[dict_id] = zstandard.ZstdCompressor(
+                level=settings.COMPRESSION_LEVEL,
+                dict_data=_zstd_dictionaries.get(dict_id),
+                write_content_size=True,
+                write_dictid=False
+            )
+        return _HEADER.pack(CODEC_ZSTD, dict_id) + compressor.compress(raw)
+
+    if dict_id:
+        compressor = zlib.compressobj(settings.COMPRESSION_LEVEL, zdict=_dictionaries[dict_id])
+    else:
+        compressor = zlib.compressobj(settings.COMPRESSION_LEVEL)
+    return _HEADER.pack(CODEC_ZLIB, dict_id) + compressor.compress(raw) + compressor.flush()
+
+
+# Deduplicated FAQ replies decode to the same few bodies over and over
+_decode_cache = BoundedCache("decoded_bodies", settings.DECODE_CACHE_ENTRIES)
+
+
+def decompress_text(value: bytes) -> str:
+    """Decode a value produced by compress_text"""
+    text = _decode_cache.get(value)
+    if text is None:
+        text = _decompress(value)
+        _decode_cache.put(value, text, sys.getsizeof(value) + sys.getsizeof(text))
+    return text
+
+
+def _decompress(value: bytes) -> str:
+    codec, dict_id = _HEADER.unpack_from(value)
+    payload = value[_HEADER.size:]
+
+    if dict_id and dict_id not in _dictionaries:
+        raise LookupError(f"Compression dictionary {dict_id} is not loaded")
+
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed messages")
+        decompressor = _zstd_decompressors.get(dict_id)
+        if decompressor is None:
+            decompressor = _zstd_decompressors[dict_id] = zstandard.ZstdDecompressor(
+                dict_data=_zstd_dictionaries.get(dict_id)
+            )
+        return decompressor.decompress(payload).decode("utf-8")
+
+    if dict_id:
+        decompressor = zlib.decompressobj(zdict=_dictionaries[dict_id])
+    else:
+        decompressor = zlib.decompressobj()
+    return (decompressor.decompress(payload) + decompressor.flush()).decode("utf-8")
+
+
+class CompressedText(TypeDecorator):
+    """
+    Text column that transparently compresses large bodies in compact mode.
+    Compressed values are stored as BLOBs; plain strings are returned unchanged,
+    so rows written in either mode can be read back.
+    """
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not is_compact() or not isinstance(value, str):
+            return value
+        if len(value) < settings.COMPRESSION_MIN_BYTES:
+            return value
+        compressed = compress_text(value)
+        return compressed if len(compressed) < len(value.encode("utf-8")) else value
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return decompress_text(bytes(value))
+        return value
+
+
+class CompactEnum(TypeDecorator):
+    """
+    Enum column that stores one-character codes ("1", "2", ...) in compact mode and member
+    names otherwise. The column keeps the VARCHAR type SQLAlchemy's Enum created (TEXT
+    affinity in SQLite), so switching modes needs no schema change and reads accept either form.
+    """
+    impl = String(20)
+    cache_ok = True
+
+    def __init__(self, enum_class: Type[enum.Enum], codes: Dict[enum.Enum, int], **kwargs):
+        super().__init__(**kwargs)
+        self.enum_class = enum_class
+        # Private names keep the (unhashable) mappings out of SQLAlchemy's statement cache key
+        self._codes = dict(codes)
+        self._members = {code: member for member, code in codes.items()}
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        member = self.enum_class(value)
+        if is_compact():
+            return str(self._codes[member])
+        return member.name
+
+    def process_result_value(self, value, dialect) -> Optional[enum.Enum]:
+        if value is None:
+            return None
+        if isinstance(value, int):
+            return self._members[value]
+        if value.isdigit():
+            return self._members[int(value)]
+        if value in self.enum_class.__members__:
+            return self.enum_class[value]
+        return self.enum_class(value)
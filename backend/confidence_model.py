@@ -0,0 +1,312 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import asyncio
+import json
+import math
+import os
+
+import numpy as np
+
+DEFAULT_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "confidence_model.json"
+)
+
+FEATURES = [
+    "retrieval_score",    # calibrated score of the top FAQ (0 if none)
+    "faq_match",          # top FAQ score reached FAQ_MATCH_THRESHOLD
+    "log_words",          # log(1 + response word count)
+    "short_response",     # fewer than 10 words
+    "hedging",            # contains a hedging phrase
+    "log_history",        # log(1 + prior messages in the session)
+    "repeated_response",  # share of recent assistant replies identical to this one
+]
+
+HEDGING_PHRASES = (
+    "i'm not sure", "i don't know", "uncertain",
+    "might be", "possibly", "perhaps", "maybe"
+)
+
+# Feature positions used by the rule-based fallback
+_FAQ_MATCH = FEATURES.index("faq_match")
+_SHORT_RESPONSE = FEATURES.index("short_response")
+_HEDGING = FEATURES.index("hedging")
+
+
+def extract_features(
+    response: str,
+    retrieval_score: float,
+    conversation_history: List[Dict],
+    match_threshold: float
+) -> List[float]:
+    """Feature vector for one response (pure Python; a few microseconds)"""
+    lower = response.lower()
+    words = len(response.split())
+    recent = [msg["content"] for msg in conversation_history[-6:] if msg["role"] == "assistant"]
+    return [
+        retrieval_score,
+        1.0 if retrieval_score >= match_threshold else 0.0,
+        math.log1p(words),
+        1.0 if words < 10 else 0.0,
+        1.0 if any(phrase in lower for phrase in HEDGING_PHRASES) else 0.0,
+        math.log1p(len(conversation_history)),
+        recent.count(response) / len(recent) if recent else 0.0,
+    ]
+
+
+def extract_features_batch(
+    responses: Sequence[str],
+    retrieval_scores: Sequence[float],
+    history_lengths: Sequence[int],
+    repeated: Sequence[float],
+    match_threshold: float
+) -> np.ndarray:
+    """
+    Column-wise feature matrix for many responses (training and replay).
+    Text features are computed per string so memory stays proportional to the numeric columns.
+    """
+    words = np.fromiter((len(response.split()) for response in responses), dtype=np.float64, count=len(responses))
+    hedging = np.fromiter(
+        (any(phrase in response.lower() for phrase in HEDGING_PHRASES) for response in responses),
+        dtype=bool, count=len(responses)
+    )
+    scores = np.asarray(retrieval_scores, dtype=np.float64)
+    return np.column_stack([
+        scores,
+        (scores >= match_threshold).astype(np.float64),
+        np.log1p(words),
+        (words < 10).astype(np.float64),
+        hedging.astype(np.float64),
+        np.log1p(np.asarray(history_lengths, dtype=np.float64)),
+        np.asarray(repeated, dtype=np.float64),
+    ])
+
+
+class HeuristicScorer:
+    """
+    The original fixed rules (0.8 base, 0.95 on an FAQ match, -0.3 when hedging, -0.1 when
+    short), used until a trained model is available
+    """
+
+    def __init__(self):
+        self.metadata = {"source": "heuristic"}
+
+    def score(self, features: Sequence[float]) -> float:
+        confidence = 0.95 if features[_FAQ_MATCH] else 0.8
+        if features[_HEDGING]:
+            confidence -= 0.3
+        if features[_SHORT_RESPONSE]:
+            confidence -= 0.1
+        return max(0.0, min(1.0, confidence))
+
+    def score_batch(self, matrix: np.ndarray) -> np.ndarray:
+        return np.fromiter((self.score(row) for row in matrix), dtype=np.float64, count=len(matrix))
+
+
+class ConfidenceScorer:
+    """Logistic-regression confidence model over FEATURES"""
+
+    def __init__(self, weights: Sequence[float], bias: float, metadata: Optional[Dict] = None):
+        if len(weights) != len(FEATURES):
+            raise ValueError(f"Expected {len(FEATURES)} weights, got {len(weights)}")
+        self.weights = [float(weight) for weight in weights]
+        self.bias = float(bias)
+        self.metadata = metadata or {}
+
+    @classmethod
+    def load(cls, path: str):
+        """Load a trained model, falling back to the original heuristic"""
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return HeuristicScorer()
+        if data.get("features") != FEATURES:
+            print("Warning: confidence model features do not match, using the heuristic")
+            return HeuristicScorer()
+        return cls(data["weights"], data["bias"], data.get("metadata"))
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({
+                "features": FEATURES,
+                "weights": self.weights,
+                "bias": self.bias,
+                "metadata": self.metadata,
+            }, f, indent=2)
+
+    def score(self, features: Sequence[float]) -> float:
+        z = self.bias
+        for weight, value in zip(self.weights, features):
+            z += weight * value
+        if z < -50.0:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def score_batch(self, matrix: np.ndarray) -> np.ndarray:
+        z = matrix @ np.asarray(self.weights) + self.bias
+        return 1.0 / (1.0 + np.exp(-np.clip(z, -50.0, 50.0)))
+
+
+def fit_logistic(X: np.ndarray, y: np.ndarray, l2: float = 1e-2, iterations: int = 100) -> Tuple[np.ndarray, float]:
+    """
+    L2-regularized logistic regression by damped Newton's method (IRLS).
+    Features are standardized internally; returns (weights, bias) on the raw scale.
+    """
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std == 0] = 1.0
+    Z = np.column_stack([(X - mean) / std, np.ones(len(X))])
+    penalty = np.full(Z.shape[1], l2)
+    penalty[-1] = 0.0
+
+    def loss(theta: np.ndarray) -> float:
+        z = Z @ theta
+        return float(np.mean(np.logaddexp(0.0, z) - y * z) + 0.5 * np.dot(penalty * theta, theta))
+
+    theta = np.zeros(Z.shape[1])
+    current = loss(theta)
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-np.clip(Z @ theta, -50.0, 50.0)))
+        grad = Z.T @ (p - y) / len(y) + penalty * theta
+        hessian = (Z * (p * (1 - p))[:, None]).T @ Z / len(y) + np.diag(penalty + 1e-9)
+        step = np.linalg.solve(hessian, grad)
+
+        # Halve the step until the loss decreases
+        scale = 1.0
+        while scale > 1e-4:
+            candidate = theta - scale * step
+            candidate_loss = loss(candidate)
+            if candidate_loss <= current:
+                break
+            scale /= 2
+        else:
+            break
+        theta, improvement, current = candidate, current - candidate_loss, candidate_loss
+        if improvement < 1e-10:
+            break
+
+    weights = theta[:-1] / std
+    bias = theta[-1] - np.dot(weights, mean)
+    return weights, float(bias)
+
+
+def _auc(labels: np.ndarray, scores: np.ndarray) -> Optional[float]:
+    """Rank-based ROC AUC"""
+    positives = labels.sum()
+    negatives = len(labels) - positives
+    if positives == 0 or negatives == 0:
+        return None
+    ranks = np.empty(len(scores))
+    ranks[np.argsort(scores, kind="mergesort")] = np.arange(1, len(scores) + 1)
+    return float((ranks[labels == 1].sum() - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+async def load_training_data(db, llm_service, match_threshold: float, window: int = 2):
+    """
+    Build (features, labels) from stored transcripts.
+
+    An assistant reply is labelled unsuccessful (0) when it is one of the last `window`
+    assistant replies before the session was escalated, successful (1) otherwise.
+    Retrieval scores are recomputed from the preceding user message.
+    """
+    from sqlalchemy import select, func
+    from models import Message, Escalation, MessageRole
+    import message_store
+
+    escalated_result = await db.execute(
+        select(Escalation.session_id, func.min(Escalation.escalated_at)).group_by(Escalation.session_id)
+    )
+    escalated_at = dict(escalated_result.all())
+
+    session_ids = (await db.execute(select(Message.session_id).distinct())).scalars().all()
+
+    responses, scores, history_lengths, repeated, labels = [], [], [], [], []
+    for session_id in session_ids:
+        transcript = await message_store.fetch_transcript(db, session_id)
+        cutoff = escalated_at.get(session_id)
+
+        history: List[Dict] = []
+        samples: List[int] = []
+        last_user_message = ""
+        for role, content, _, timestamp in transcript:
+            if role == MessageRole.ASSISTANT and (cutoff is None or timestamp <= cutoff):
+                # History seen by the model excludes the user message it is answering
+                prior = history[:-1] if history and history[-1]["role"] == "user" else history
+                matches = llm_service._search_faq(last_user_message)
+                recent = [msg["content"] for msg in prior[-6:] if msg["role"] == "assistant"]
+
+                responses.append(content)
+                scores.append(matches[0][1] if matches else 0.0)
+                history_lengths.append(len(prior))
+                repeated.append(recent.count(content) / len(recent) if recent else 0.0)
+                labels.append(1.0)
+                samples.append(len(labels) - 1)
+            if role == MessageRole.USER:
+                last_user_message = content
+            history.append({"role": role.value, "content": content})
+
+        if cutoff is not None:
+            for index in samples[-window:]:
+                labels[index] = 0.0
+
+    X = extract_features_batch(responses, scores, history_lengths, repeated, match_threshold) \
+        if responses else np.zeros((0, len(FEATURES)))
+    return X, np.asarray(labels)
+
+
+async def _main():
+    from config import get_settings
+    from database import async_session_factory, init_db, close_db
+    from llm_service import LLMService
+
+    settings = get_settings()
+
+    parser = argparse.ArgumentParser(description="Train or replay the response confidence model")
+    parser.add_argument("command", choices=["train", "replay"],
+                        help="train: fit on messages/escalations; replay: batch-score history with the current model")
+    parser.add_argument("--model", default=settings.CONFIDENCE_MODEL_PATH or DEFAULT_MODEL_PATH)
+    parser.add_argument("--window", type=int, default=2,
+                        help="assistant replies before an escalation labelled unsuccessful")
+    parser.add_argument("--l2", type=float, default=1e-2)
+    args = parser.parse_args()
+
+    await init_db()
+    llm_service = LLMService()
+    async with async_session_factory() as db:
+        X, y = await load_training_data(db, llm_service, settings.FAQ_MATCH_THRESHOLD, args.window)
+    await close_db()
+
+    if args.command == "train":
+        if len(y) == 0 or y.min() == y.max():
+            print("[WARNING] Need both escalated and non-escalated replies to train; model not written")
+            return
+        weights, bias = fit_logistic(X, y, l2=args.l2)
+        scorer = ConfidenceScorer(weights, bias, {
+            "source": "trained",
+            "trained_at": datetime.utcnow().isoformat(),
+            "samples": int(len(y)),
+            "positive_rate": float(y.mean()),
+        })
+        predictions = scorer.score_batch(X)
+        scorer.metadata["train_auc"] = _auc(y, predictions)
+        scorer.save(args.model)
+        print(f"[OK] Trained on {len(y)} replies, AUC {scorer.metadata['train_auc']}, saved to {args.model}")
+        for name, weight in zip(FEATURES, scorer.weights):
+            print(f"   {name:<18}{weight:+.3f}")
+        return
+
+    scorer = ConfidenceScorer.load(args.model)
+    heuristic = HeuristicScorer()
+    threshold = settings.CONFIDENCE_THRESHOLD
+    for label, model in (("current model", scorer), ("heuristic", heuristic)):
+        predictions = model.score_batch(X) if len(y) else np.zeros(0)
+        flagged = predictions < threshold
+        unnecessary = int(np.sum(flagged & (y == 1)))
+        missed = int(np.sum(~flagged & (y == 0)))
+        print(f"{label:<14} escalations {int(flagged.sum()):>6}  unnecessary {unnecessary:>6}  "
+              f"missed {missed:>6}  AUC {_auc(y, predictions)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
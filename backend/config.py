@@ -11,7 +11,13 @@ class Settings(BaseSettings):
     OPENAI_MODEL: str = "gpt-4"
     GEMINI_API_KEY: Optional[str] = None
     GEMINI_MODEL: str = "gemini-2.5-flash"
-    AI_PROVIDER: str = "gemini"  # "openai" or "gemini" or "mock"
+    AI_PROVIDER: str = "gemini"  # "openai", "gemini", "mock", "record" or "replay"
+    
+    # Provider Record/Replay Configuration
+    RECORDING_PROVIDER: str = "gemini"  # Real provider wrapped by "record" and emulated by "replay"
+    RECORDING_PATH: str = "./llm_recording.jsonl"
+    REPLAY_LATENCY_SCALE: float = 1.0  # Multiplier on recorded latencies; 0 replies instantly
+    REPLAY_STRICT: bool = False  # Fail unrecorded requests, and recordings of another FAQ setup, instead of serving a hash-picked recording
     
     # Application Settings
     APP_NAME: str = "AI Customer Support Bot"
@@ -21,8 +27,54 @@ class Settings(BaseSettings):
     SESSION_TIMEOUT_MINUTES: int = 30
     MAX_CONVERSATION_HISTORY: int = 10
     
+    # Message Storage Configuration
+    MESSAGE_STORAGE_MODE: str = "plain"  # "plain" or "compact"
+    COMPRESSION_MIN_BYTES: int = 256  # Bodies shorter than this are never compressed
+    COMPRESSION_LEVEL: int = 6
+    DEDUPE_MIN_BYTES: int = 64  # Assistant replies at least this long are stored by content hash
+    
+    # Write-Behind Persistence Configuration
+    WRITE_BEHIND_ENABLED: bool = False  # Queue chat messages and bulk-insert them in the background
+    WRITE_BEHIND_LOG_PATH: str = "./write_behind.log"  # Append-only replay log; empty keeps the queue in memory only
+    WRITE_BEHIND_FSYNC: bool = False  # fsync every append (survives power loss, costs latency)
+    WRITE_BEHIND_BATCH_SIZE: int = 500  # Messages per bulk insert
+    WRITE_BEHIND_FLUSH_INTERVAL_MS: int = 200
+    WRITE_BEHIND_MAX_PENDING: int = 10000  # Requests wait for a flush beyond this backlog
+    WRITE_BEHIND_LOG_COMPACT_BYTES: int = 8 * 1024 * 1024  # Rewrite the log (off the event loop) past this
+    
+    # Memory Configuration (per worker)
+    MEMORY_CACHE_BUDGET_MB: float = 32  # Shared byte budget for in-process caches; LRU entries are evicted beyond it
+    FAQ_SEARCH_CACHE_ENTRIES: int = 4096  # Cached FAQ rankings for repeated questions; 0 disables
+    DECODE_CACHE_ENTRIES: int = 1024  # Decoded compact message bodies
+    
+    # Admission Control Configuration
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENT: int = 16  # Concurrent provider calls per worker
+    ADMISSION_QUEUE_SLO_SECONDS: float = 5.0  # Shed load with Retry-After beyond this wait
+    ADMISSION_MAX_QUEUE: int = 256
+    ADMISSION_TENANT_WEIGHTS: dict = {}  # e.g. {"tenant-a": 2.0}; must be > 0; unlisted tenants get 1.0
+    ADMISSION_LONG_SESSION_MESSAGES: int = 10  # Sessions this long get priority
+    
+    # Tracing Configuration
+    TRACING_ENABLED: bool = False
+    TRACING_SAMPLE_RATE: float = 1.0  # Fraction of new traces recorded
+    TRACING_EXPORTER: str = "file"  # "file" or "memory"
+    TRACING_FILE: str = "./traces.jsonl"
+    
+    # FAQ Retrieval Configuration
+    FAQ_SEMANTIC_SEARCH: bool = True
+    FAQ_EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"  # sentence-transformers model, used when installed; empty forces hashed n-grams
+    FAQ_EMBEDDING_DIM: int = 1024  # Hashed n-gram embedding size
+    FAQ_TOP_K: int = 3  # FAQs passed to the model as context
+    FAQ_MIN_SIMILARITY: float = 0.6  # Calibrated score needed to appear in context
+    FAQ_MATCH_THRESHOLD: float = 0.7  # Calibrated score treated as a confident FAQ match
+    FAQ_KEYWORD_SCORE: float = 0.9  # Score given to keyword matches
+    FAQ_LEXICAL_MAX_SCORE: float = 0.65  # Cap on hashed n-gram scores; keep below FAQ_MATCH_THRESHOLD
+    FAQ_HNSW_MIN_ITEMS: int = 5000  # Use an HNSW index (if hnswlib is installed) above this size
+    
     # Escalation Configuration
     CONFIDENCE_THRESHOLD: float = 0.7
+    CONFIDENCE_MODEL_PATH: str = ""  # Trained scorer JSON; empty uses data/confidence_model.json
     MAX_LOOP_DETECTION: int = 3
     
     # CORS Settings
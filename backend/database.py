@@ -1,8 +1,9 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy import exc
+from sqlalchemy import event, exc, inspect, text
 from typing import AsyncGenerator
 from models import Base
 from config import get_settings
+from tracing import tracer
 
 settings = get_settings()
 
@@ -14,6 +15,23 @@ engine = create_async_engine(
     connect_args={"check_same_thread": False}
 )
 
+# Trace every SQL statement as a child of the current request span
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _trace_statement_start(conn, cursor, statement, parameters, context, executemany):
+    if tracer.enabled:
+        context._trace_span = tracer.start_leaf_span(
+            "db.execute", **{"db.system": "sqlite", "db.statement": statement}
+        )
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _trace_statement_end(conn, cursor, statement, parameters, context, executemany):
+    tracer.end_leaf_span(getattr(context, "_trace_span", None))
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _trace_statement_error(exception_context):
+    context = exception_context.execution_context
+    tracer.end_leaf_span(getattr(context, "_trace_span", None), exception_context.original_exception)
+
 # Create async session factory
 async_session_factory = async_sessionmaker(
     engine,
@@ -35,10 +53,24 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         finally:
             await session.close()
 
+def _upgrade_schema(connection):
+    """Add nullable columns and indexes introduced after a table was first created"""
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
 async def init_db():
     """Initialize database tables"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_upgrade_schema)
 
 async def close_db():
     """Close database connections"""
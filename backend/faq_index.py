@@ -0,0 +1,318 @@
+from typing import List, Optional, Sequence, Tuple
+import re
+import zlib
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Platt-scaling parameters used when there are too few FAQs to fit them
+DEFAULT_CALIBRATION = (10.0, -5.0)
+
+# FAQs sampled when fitting the calibration (keeps the pairwise matrix small)
+CALIBRATION_SAMPLE = 512
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+# Function words carry no intent; left in, "what is the weather" resembles "what is your refund policy"
+STOPWORDS = frozenset("""
+a about am an and any are as at be been but by can could did do does for from had has have
+how i i'm if in is it it's me my of on or our so than that the their them then there these
+this to too was we what when where which who why will with would you your
+""".split())
+
+# Support-domain synonym groups for the hashing fallback: every phrase in a group emits the
+# same concept feature, so paraphrases ("I'm locked out") reach FAQs worded differently
+# ("reset password"). Only unambiguous phrases belong here; everyday words such as "open",
+# "phone" or "safe" would pull unrelated questions onto an FAQ.
+SYNONYM_GROUPS = {
+    "access": ("password", "passwords", "log in", "login", "logon", "sign in", "signin", "locked out",
+               "get into my account", "access my account", "credentials"),
+    "refund": ("refund", "refunds", "money back", "reimburse", "reimbursement"),
+    "delivery": ("package", "parcel", "shipment", "shipping", "shipped", "delivery", "delivered",
+                 "tracking", "track my order", "order status", "where is my order"),
+    "hours": ("business hours", "opening hours", "support hours", "when are you open",
+              "what time do you open", "what time do you close"),
+    "technical": ("crash", "crashes", "crashing", "bug", "bugs", "glitch", "error message",
+                  "not working", "doesn't work", "technical"),
+    "human": ("human", "real person", "live person", "agent", "representative", "operator",
+              "talk to someone", "speak to someone", "speak with someone", "customer service",
+              "live chat"),
+    "cancel": ("cancel", "cancellation", "terminate", "unsubscribe", "stop my subscription"),
+    "upgrade": ("upgrade", "premium", "higher tier", "better plan", "bigger plan"),
+    "payment": ("payment", "payments", "credit card", "credit cards", "debit card", "paypal",
+                "billing", "pay with"),
+    "privacy": ("privacy", "private", "secure", "security", "encryption", "gdpr", "personal data",
+                "personal information"),
+    "exchange": ("exchange", "exchangeable", "swap", "substitute", "different size", "different item"),
+}
+
+_SYNONYM_PATTERNS = [
+    (f"#{concept}", re.compile(r"\b(?:" + "|".join(re.escape(phrase) for phrase in phrases) + r")\b"))
+    for concept, phrases in SYNONYM_GROUPS.items()
+]
+# Changes whenever the vocabulary tables do, since they change the scores
+_VOCABULARY_DIGEST = format(zlib.crc32(repr((sorted(STOPWORDS), SYNONYM_GROUPS)).encode("utf-8")), "08x")
+
+
+class HashingEmbedder:
+    """
+    Offline embedder: hashed word, word-bigram, character n-gram and synonym-group features
+    over non-stopwords, IDF-weighted over the indexed corpus and L2-normalized. Needs no
+    model files or network.
+    """
+    name = "hashing"
+    # Scores reflect word overlap rather than meaning, so they never make a confident match alone
+    lexical = True
+
+    def __init__(self, dim: int = 1024, char_ngrams: Tuple[int, int] = (3, 5)):
+        # Power of two so the bucket is a mask of the hash
+        self.dim = 1 << max(1, dim - 1).bit_length()
+        self.char_ngrams = char_ngrams
+        self.idf = np.ones(self.dim, dtype=np.float32)
+
+    @property
+    def signature(self) -> str:
+        """Identifies the scores this embedder produces"""
+        return f"{self.name}/{self.dim}/{_VOCABULARY_DIGEST}"
+
+    def _features(self, text: str) -> List[Tuple[str, float]]:
+        lower = text.lower()
+        words = [word for word in _TOKEN_PATTERN.findall(lower) if word not in STOPWORDS]
+        features = [(word, 1.0) for word in words]
+        features.extend((f"{a} {b}", 1.0) for a, b in zip(words, words[1:]))
+        low, high = self.char_ngrams
+        for word in words:
+            padded = f" {word} "
+            for n in range(low, high + 1):
+                features.extend((padded[i:i + n], 0.25) for i in range(len(padded) - n + 1))
+        for concept, pattern in _SYNONYM_PATTERNS:
+            features.extend((concept, 2.0) for _ in pattern.finditer(lower))
+        return features
+
+    def _raw(self, texts: Sequence[str]) -> np.ndarray:
+        rows, cols, values = [], [], []
+        mask = self.dim - 1
+        for row, text in enumerate(texts):
+            for token, weight in self._features(text):
+                h = zlib.crc32(token.encode("utf-8"))
+                rows.append(row)
+                cols.append(h & mask)
+                values.append(weight if h & 0x80000000 else -weight)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)),
+                  np.asarray(values, dtype=np.float32))
+        return matrix
+
+    @property
+    def nbytes(self) -> int:
+        return self.idf.nbytes
+
+    def fit(self, texts: Sequence[str]):
+        """Learn per-bucket IDF weights so common words contribute less"""
+        matrix = self._raw(texts)
+        document_frequency = np.count_nonzero(matrix, axis=0)
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1.0).astype(np.float32)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = self._raw(texts) * self.idf
+        return _normalize(matrix)
+
+
+class SentenceTransformerEmbedder:
+    """Small local CPU embedding model via sentence-transformers"""
+    name = "sentence-transformers"
+    lexical = False
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    @property
+    def signature(self) -> str:
+        return f"{self.name}/{self.model_name}"
+
+    @property
+    def nbytes(self) -> int:
+        return sum(parameter.numel() * parameter.element_size() for parameter in self.model.parameters())
+
+    def fit(self, texts: Sequence[str]):
+        pass
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self.model.encode(list(texts), batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(x, -50.0, 50.0)))
+
+
+def fit_platt(positives: np.ndarray, negatives: np.ndarray, iterations: int = 50) -> Tuple[float, float]:
+    """
+    Fit p = sigmoid(a * similarity + b) by damped Newton's method on the log-loss,
+    weighting both classes equally (so 0.5 means "as likely a match as not" regardless
+    of corpus size) with a light L2 penalty. Returns (a, b).
+    """
+    x = np.concatenate([positives, negatives]).astype(np.float64)
+    y = np.concatenate([np.ones(len(positives)), np.zeros(len(negatives))])
+    w = np.concatenate([
+        np.full(len(positives), 0.5 / len(positives)),
+        np.full(len(negatives), 0.5 / len(negatives)),
+    ])
+    l2 = 1e-3
+
+    def loss(params: np.ndarray) -> float:
+        z = params[0] * x + params[1]
+        return float(np.dot(w, np.logaddexp(0.0, z) - y * z) + 0.5 * l2 * np.dot(params, params))
+
+    params = np.zeros(2)
+    current = loss(params)
+    for _ in range(iterations):
+        p = _sigmoid(params[0] * x + params[1])
+        residual = w * (p - y)
+        grad = np.array([np.dot(residual, x), residual.sum()]) + l2 * params
+        curvature = w * p * (1 - p)
+        hessian = np.array([
+            [np.dot(curvature, x * x), np.dot(curvature, x)],
+            [np.dot(curvature, x), curvature.sum()],
+        ]) + l2 * np.eye(2)
+        step = np.linalg.solve(hessian, grad)
+
+        # Halve the step until the loss decreases
+        scale = 1.0
+        while scale > 1e-4:
+            candidate = params - scale * step
+            candidate_loss = loss(candidate)
+            if candidate_loss <= current:
+                break
+            scale /= 2
+        else:
+            break
+        params, improvement, current = candidate, current - candidate_loss, candidate_loss
+        if improvement < 1e-10:
+            break
+    return float(params[0]), float(params[1])
+
+
+def _faq_document(faq) -> str:
+    return f"{faq.question} {' '.join(faq.keywords)} {faq.answer}"
+
+
+class FAQIndex:
+    """
+    Semantic index over FAQ records (objects with question, answer and keywords attributes).
+
+    Every FAQ is embedded once into a contiguous float32 matrix; queries are scored with a
+    single matrix product (or an HNSW index above `hnsw_min_items` when hnswlib is installed).
+    Cosine similarities are mapped to calibrated relevance probabilities with Platt scaling
+    fitted on each FAQ's own keywords/question (positives) against the other FAQs (negatives).
+    """
+
+    def __init__(
+        self,
+        faqs: Sequence,
+        embedder,
+        hnsw_min_items: int = 5000,
+        calibration: Optional[Tuple[float, float]] = None
+    ):
+        self.faqs = faqs
+        self.embedder = embedder
+
+        documents = [_faq_document(faq) for faq in faqs]
+        embedder.fit(documents)
+        self.matrix = embedder.embed(documents) if faqs else np.zeros((0, embedder.dim), dtype=np.float32)
+
+        self.hnsw = None
+        if hnswlib is not None and len(faqs) >= hnsw_min_items:
+            self.hnsw = hnswlib.Index(space="ip", dim=self.matrix.shape[1])
+            self.hnsw.init_index(max_elements=len(faqs), ef_construction=200, M=16)
+            self.hnsw.add_items(self.matrix, np.arange(len(faqs)))
+            self.hnsw.set_ef(64)
+
+        self.calibration = calibration or self._fit_calibration()
+
+    def __len__(self) -> int:
+        return len(self.faqs)
+
+    @property
+    def nbytes(self) -> int:
+        """Embedding matrix, embedder state and (approximate) HNSW graph"""
+        size = self.matrix.nbytes + self.embedder.nbytes
+        if self.hnsw is not None:
+            # Vector plus 2 * M level-0 links and a label per element
+            size += self.hnsw.get_current_count() * (self.matrix.shape[1] * 4 + 2 * 16 * 4 + 12)
+        return size
+
+    def _fit_calibration(self) -> Tuple[float, float]:
+        """
+        Fit Platt scaling on self-labelled pairs: each FAQ's keywords and question are
+        short user-like queries that should match that FAQ and no other.
+        """
+        count = min(len(self.faqs), CALIBRATION_SAMPLE)
+        if count < 2:
+            return DEFAULT_CALIBRATION
+
+        queries, owners = [], []
+        for position, faq in enumerate(self.faqs[:count]):
+            for query in (faq.question,) + faq.keywords:
+                queries.append(query)
+                owners.append(position)
+
+        owners = np.asarray(owners)
+        similarities = self.embedder.embed(queries) @ self.matrix[:count].T
+        positive = np.zeros_like(similarities, dtype=bool)
+        positive[np.arange(len(queries)), owners] = True
+        return fit_platt(similarities[positive], similarities[~positive])
+
+    def calibrate(self, similarities: np.ndarray) -> np.ndarray:
+        a, b = self.calibration
+        return _sigmoid(a * similarities + b)
+
+    def search_batch(self, queries: Sequence[str], k: int = 3) -> List[List[Tuple[int, float]]]:
+        """Top-k (faq position, calibrated score) per query, best first"""
+        if not self.faqs or not queries:
+            return [[] for _ in queries]
+        k = min(k, len(self.faqs))
+        vectors = self.embedder.embed(queries)
+
+        if self.hnsw is not None:
+            labels, distances = self.hnsw.knn_query(vectors, k=k)
+            scores = self.calibrate(1.0 - distances)
+            return [list(zip(row_labels.tolist(), row_scores.tolist()))
+                    for row_labels, row_scores in zip(labels, scores)]
+
+        similarities = vectors @ self.matrix.T
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_similarities = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_similarities, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        scores = self.calibrate(np.take_along_axis(top_similarities, order, axis=1))
+        return [list(zip(row_top.tolist(), row_scores.tolist())) for row_top, row_scores in zip(top, scores)]
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[int, float]]:
+        return self.search_batch([query], k)[0]
+
+
+def build_embedder(model_name: str, dim: int):
+    """Local embedding model when configured and loadable, hashed n-grams otherwise"""
+    if model_name:
+        try:
+            return SentenceTransformerEmbedder(model_name)
+        except ImportError:
+            print("[INFO] sentence-transformers not installed, using hashed n-gram embeddings")
+        except Exception as e:
+            # e.g. the model is not cached locally and there is no network
+            print(f"[WARNING] Could not load embedding model {model_name}: {e}; using hashed n-gram embeddings")
+    return HashingEmbedder(dim)
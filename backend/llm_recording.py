@@ -0,0 +1,271 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Gemini requests are a prompt string; OpenAI requests are the chat messages as [type, content] pairs
+Request = Union[str, List[List[str]]]
+
+
+def request_key(provider: str, request: Request) -> str:
+    """Stable hash of a provider request (model name excluded so recordings survive upgrades)"""
+    canonical = json.dumps([provider, request], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _chat_request(messages) -> List[List[str]]:
+    return [[message.type, message.content] for message in messages]
+
+
+class _RecordedResponse:
+    """Stands in for a provider response object (Gemini `.text`, LangChain `.content`)"""
+    __slots__ = ("text", "content")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.content = text
+
+
+class RecordingWriter:
+    """
+    Appends prompt -> response pairs with their latency to a JSON lines file.
+
+    Each entry carries `context` (the FAQ embedder and FAQ data digest) because prompts
+    embed FAQ relevance scores; replay checks it against its own.
+    """
+
+    def __init__(self, path: str, context: Optional[Dict[str, str]] = None):
+        self.path = path
+        self.context = context
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self.recorded = 0
+
+    def append(self, provider: str, model: str, request: Request, response: str, latency: float):
+        line = json.dumps({
+            "key": request_key(provider, request),
+            "provider": provider,
+            "model": model,
+            "request": request,
+            "response": response,
+            "latency_ms": round(latency * 1000, 3),
+            "recorded_at": datetime.utcnow().isoformat(),
+            "context": self.context,
+        }, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self.recorded += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RecordingGeminiModel:
+    """Wraps a GenerativeModel and records every generate_content call"""
+
+    def __init__(self, model, writer: RecordingWriter, model_name: str):
+        self._model = model
+        self._writer = writer
+        self._model_name = model_name
+
+    def generate_content(self, prompt: str):
+        start = time.perf_counter()
+        response = self._model.generate_content(prompt)
+        self._writer.append("gemini", self._model_name, prompt, response.text, time.perf_counter() - start)
+        return response
+
+
+class RecordingChatModel:
+    """Wraps a LangChain chat model and records every ainvoke call"""
+
+    def __init__(self, llm, writer: RecordingWriter, model_name: str):
+        self._llm = llm
+        self._writer = writer
+        self._model_name = model_name
+
+    async def ainvoke(self, messages):
+        start = time.perf_counter()
+        response = await self._llm.ainvoke(messages)
+        self._writer.append(
+            "openai", self._model_name, _chat_request(messages), response.content, time.perf_counter() - start
+        )
+        return response
+
+
+class ReplayMiss(LookupError):
+    """A request with no recorded response; never turned into a fallback reply"""
+
+
+class ReplayContextMismatch(ValueError):
+    """The recording was made with another FAQ setup, so its prompts cannot match this worker's"""
+
+
+class ReplayProvider:
+    """
+    Serves recorded responses deterministically.
+
+    Requests are matched by hash and always get the first response recorded for them, so
+    transcripts are identical however requests interleave; repeated requests cycle through
+    all latencies recorded for them, delayed by `latency_scale` (0 disables the delay).
+    Unknown requests raise ReplayMiss in strict mode; otherwise they get a recording
+    picked by request hash, so reruns stay reproducible.
+
+    Entries recorded under a different `context` than the replaying worker's would all
+    miss: that is a warning, or ReplayContextMismatch in strict mode.
+    """
+
+    def __init__(
+        self,
+        entries: List[Dict],
+        latency_scale: float = 1.0,
+        strict: bool = False,
+        context: Optional[Dict[str, str]] = None
+    ):
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self._entries = entries
+        self._by_key: Dict[str, List[Dict]] = {}
+        for entry in entries:
+            self._by_key.setdefault(entry["key"], []).append(entry)
+        self._served: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if context is not None:
+            self._check_context(context)
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        latency_scale: float = 1.0,
+        strict: bool = False,
+        context: Optional[Dict[str, str]] = None
+    ) -> "ReplayProvider":
+        with open(path, "r", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        return cls(entries, latency_scale, strict, context)
+
+    def _check_context(self, context: Dict[str, str]):
+        untagged = sum(1 for entry in self._entries if entry.get("context") is None)
+        mismatched = [
+            entry["context"] for entry in self._entries
+            if entry.get("context") is not None and entry["context"] != context
+        ]
+        if mismatched:
+            message = (
+                f"{len(mismatched)} of {len(self._entries)} recorded responses were made with FAQ setup "
+                f"{mismatched[0]}, but this worker has {context}; their prompts may not match"
+            )
+            if self.strict:
+                raise ReplayContextMismatch(message)
+            print(f"[WARNING] {message}")
+        if untagged:
+            print(f"[WARNING] {untagged} recorded responses have no FAQ setup to check; re-record to verify them")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def serve(self, provider: str, request: Request) -> Tuple[str, float]:
+        """Return (response text, seconds to wait) for a request"""
+        key = request_key(provider, request)
+        with self._lock:
+            recordings = self._by_key.get(key)
+            if recordings:
+                self.hits += 1
+                served = self._served.get(key, 0)
+                self._served[key] = served + 1
+                response = recordings[0]["response"]
+                latency_ms = recordings[served % len(recordings)]["latency_ms"]
+            else:
+                self.misses += 1
+                if self.strict or not self._entries:
+                    raise ReplayMiss(f"No recorded {provider} response for request {key[:12]}")
+                entry = self._entries[int(key[:8], 16) % len(self._entries)]
+                response, latency_ms = entry["response"], entry["latency_ms"]
+        return response, latency_ms / 1000 * self.latency_scale
+
+    def stats(self) -> Dict:
+        return {
+            "recordings": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "latency_scale": self.latency_scale,
+            **latency_summary(self._entries),
+        }
+
+
+class ReplayGeminiModel:
+    """Drop-in for GenerativeModel; blocks its executor thread like the real client"""
+
+    def __init__(self, replay: ReplayProvider):
+        self._replay = replay
+
+    def generate_content(self, prompt: str) -> _RecordedResponse:
+        text, delay = self._replay.serve("gemini", prompt)
+        if delay > 0:
+            time.sleep(delay)
+        return _RecordedResponse(text)
+
+
+class ReplayChatModel:
+    """Drop-in for a LangChain chat model's ainvoke"""
+
+    def __init__(self, replay: ReplayProvider):
+        self._replay = replay
+
+    async def ainvoke(self, messages) -> _RecordedResponse:
+        text, delay = self._replay.serve("openai", _chat_request(messages))
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return _RecordedResponse(text)
+
+
+def latency_summary(entries: List[Dict]) -> Dict:
+    """Recorded latency distribution in milliseconds"""
+    latencies = sorted(entry["latency_ms"] for entry in entries)
+    if not latencies:
+        return {"latency_ms_p50": None, "latency_ms_p95": None, "latency_ms_p99": None}
+
+    def percentile(fraction: float) -> float:
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    return {
+        "latency_ms_p50": percentile(0.50),
+        "latency_ms_p95": percentile(0.95),
+        "latency_ms_p99": percentile(0.99),
+    }
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Inspect a provider recording")
+    parser.add_argument("command", choices=["stats"])
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    replay = ReplayProvider.load(args.path)
+    providers: Dict[str, int] = {}
+    contexts: Dict[str, int] = {}
+    for entry in replay._entries:
+        providers[entry["provider"]] = providers.get(entry["provider"], 0) + 1
+        context = json.dumps(entry.get("context"), sort_keys=True)
+        contexts[context] = contexts.get(context, 0) + 1
+    print(json.dumps({
+        "providers": providers,
+        "contexts": contexts,
+        "unique_requests": len(replay._by_key),
+        **replay.stats(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    _main()
@@ -1,17 +1,51 @@
+import hashlib
 import json
 import re
-import random
-from typing import List, Dict, Tuple
+import sys
+import zlib
+from array import array
+from typing import List, Dict, Optional, Tuple
 from config import get_settings
+from tracing import tracer
+from confidence_model import ConfidenceScorer, DEFAULT_MODEL_PATH, HEDGING_PHRASES, extract_features
+from memory import BoundedCache, accountant, deep_sizeof
+from llm_recording import ReplayMiss
 
 settings = get_settings()
 
+def _pick(options: List[str], seed: str) -> str:
+    """Deterministic choice so identical inputs always get identical mock replies"""
+    return options[zlib.crc32(seed.encode("utf-8")) % len(options)]
+
+class FAQRecord:
+    """One FAQ entry; __slots__, tuples and interned keywords keep large FAQ sets compact"""
+    __slots__ = ("id", "question", "answer", "category", "keywords", "keywords_lower")
+    
+    def __init__(self, data: Dict):
+        self.id = data.get("id")
+        self.question = data.get("question", "")
+        self.answer = data.get("answer", "")
+        self.category = sys.intern(data.get("category", ""))
+        self.keywords = tuple(sys.intern(keyword) for keyword in data.get("keywords", []))
+        self.keywords_lower = tuple(sys.intern(keyword.lower()) for keyword in self.keywords)
+
 class LLMService:
     def __init__(self):
         self.ai_provider = settings.AI_PROVIDER.lower()
         self.use_ai = False
+        self.recorder = None
+        self.replay = None
+        
+        # Loaded before the provider: recordings are tagged with the FAQ setup that shaped their prompts
+        self.faq_data = self._load_faqs()
+        self.faq_index = self._build_faq_index()
         
-        if self.ai_provider == "gemini" and settings.GEMINI_API_KEY:
+        # "record" runs the real provider named by RECORDING_PROVIDER and captures its traffic
+        provider = settings.RECORDING_PROVIDER.lower() if self.ai_provider == "record" else self.ai_provider
+        
+        if self.ai_provider == "replay":
+            self._init_replay()
+        elif provider == "gemini" and settings.GEMINI_API_KEY:
             try:
                 import google.generativeai as genai
                 genai.configure(api_key=settings.GEMINI_API_KEY)
@@ -22,7 +56,7 @@ class LLMService:
             except ImportError:
                 print("[WARNING] Gemini dependencies not available, using mock responses")
                 self.use_ai = False
-        elif self.ai_provider == "openai" and settings.OPENAI_API_KEY:
+        elif provider == "openai" and settings.OPENAI_API_KEY:
             try:
                 from langchain_openai import ChatOpenAI
                 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
@@ -38,20 +72,82 @@ class LLMService:
                 print("[WARNING] OpenAI dependencies not available, using mock responses")
                 self.use_ai = False
         else:
-            print(f"[INFO] No {self.ai_provider.upper()} API key provided, using mock responses for demo")
+            print(f"[INFO] No {provider.upper()} API key provided, using mock responses for demo")
+        
+        if self.ai_provider == "record" and self.use_ai:
+            self._init_recording()
 
-        self.faq_data = self._load_faqs()
+        self.faq_search_cache = BoundedCache("faq_search", settings.FAQ_SEARCH_CACHE_ENTRIES)
+        self.confidence_scorer = ConfidenceScorer.load(settings.CONFIDENCE_MODEL_PATH or DEFAULT_MODEL_PATH)
         self.escalation_keywords = [
             "speak to human", "talk to agent", "human support",
             "real person", "escalate", "supervisor", "manager"
         ]
-        
-    def _load_faqs(self) -> List[Dict]:
+        self._register_memory()
+        
+    def _init_recording(self):
+        """Wrap the real provider client so every call is captured to RECORDING_PATH"""
+        from llm_recording import RecordingWriter, RecordingGeminiModel, RecordingChatModel
+        self.recorder = RecordingWriter(settings.RECORDING_PATH, self._recording_context())
+        if self.ai_type == "gemini":
+            self.model = RecordingGeminiModel(self.model, self.recorder, settings.GEMINI_MODEL)
+        else:
+            self.llm = RecordingChatModel(self.llm, self.recorder, settings.OPENAI_MODEL)
+        print(f"[OK] Recording {self.ai_type} requests to {settings.RECORDING_PATH}")
+    
+    def _init_replay(self):
+        """Serve recorded responses through the real provider code path, with no network"""
+        from llm_recording import ReplayProvider, ReplayGeminiModel, ReplayChatModel
+        ai_type = settings.RECORDING_PROVIDER.lower()
+        try:
+            self.replay = ReplayProvider.load(
+                settings.RECORDING_PATH, settings.REPLAY_LATENCY_SCALE, settings.REPLAY_STRICT,
+                context=self._recording_context()
+            )
+        except FileNotFoundError:
+            print(f"[WARNING] Recording {settings.RECORDING_PATH} not found, using mock responses")
+            return
+        if ai_type == "openai":
+            try:
+                import langchain_core.messages  # noqa: F401 (needed to build the OpenAI prompt)
+            except ImportError:
+                print("[WARNING] OpenAI dependencies not available, using mock responses")
+                return
+            self.llm = ReplayChatModel(self.replay)
+        else:
+            ai_type = "gemini"
+            self.model = ReplayGeminiModel(self.replay)
+        self.use_ai = True
+        self.ai_type = ai_type
+        print(f"[OK] Replaying {len(self.replay)} recorded {ai_type} responses "
+              f"(latency x{settings.REPLAY_LATENCY_SCALE})")
+    
+    def _recording_context(self) -> Dict[str, str]:
+        """FAQ embedder and a digest of the FAQ data and search settings behind the prompts' relevance scores"""
+        digest = hashlib.sha256()
+        for value in (
+            [[faq.id, faq.question, faq.answer, list(faq.keywords)] for faq in self.faq_data],
+            [settings.FAQ_TOP_K, settings.FAQ_MIN_SIMILARITY, settings.FAQ_KEYWORD_SCORE, settings.FAQ_LEXICAL_MAX_SCORE],
+        ):
+            digest.update(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        return {
+            "faq_embedder": self.faq_index.embedder.signature if self.faq_index is not None else "keywords",
+            "faq_digest": digest.hexdigest()[:16],
+        }
+    
+    def _register_memory(self):
+        """Report the size of this worker's static data (caches report themselves)"""
+        accountant.register("faq_records", deep_sizeof(self.faq_data))
+        accountant.register("faq_index", self.faq_index.nbytes if self.faq_index is not None else 0)
+        accountant.register("phrase_lists", deep_sizeof(self.escalation_keywords) + deep_sizeof(HEDGING_PHRASES))
+        accountant.register("confidence_model", deep_sizeof(self.confidence_scorer))
+    
+    def _load_faqs(self) -> List[FAQRecord]:
         """Load FAQ data from JSON file"""
         try:
             with open("../data/faqs.json", "r") as f:
                 data = json.load(f)
-                return data.get("faqs", [])
+                return [FAQRecord(faq) for faq in data.get("faqs", [])]
         except FileNotFoundError:
             print("Warning: faqs.json not found")
             return []
@@ -59,15 +155,64 @@ class LLMService:
             print("Warning: Invalid JSON in faqs.json")
             return []
     
-    def _search_faq(self, query: str) -> str:
-        """Search FAQ database for relevant answers"""
+    def _build_faq_index(self):
+        """Embed every FAQ once for semantic search"""
+        if not settings.FAQ_SEMANTIC_SEARCH or not self.faq_data:
+            return None
+        try:
+            from faq_index import FAQIndex, build_embedder
+        except ImportError:
+            print("[WARNING] numpy not available, using keyword FAQ search only")
+            return None
+        embedder = build_embedder(settings.FAQ_EMBEDDING_MODEL, settings.FAQ_EMBEDDING_DIM)
+        return FAQIndex(self.faq_data, embedder, hnsw_min_items=settings.FAQ_HNSW_MIN_ITEMS)
+    
+    def _search_faq(self, query: str) -> List[Tuple[FAQRecord, float]]:
+        """Rank FAQs for a query by calibrated relevance (semantic matches plus keyword hits)"""
+        # Repeated questions skip embedding; entries are two small arrays (positions, scores)
+        key = " ".join(query.lower().split())
+        cached = self.faq_search_cache.get(key)
+        if cached is not None:
+            positions, ranked_scores = cached
+            return [(self.faq_data[position], score) for position, score in zip(positions, ranked_scores)]
+        
+        scores = {}
+        if self.faq_index is not None:
+            # Hashed n-gram matches rank the context but need a keyword hit to count as an FAQ match
+            cap = settings.FAQ_LEXICAL_MAX_SCORE if self.faq_index.embedder.lexical else 1.0
+            for position, score in self.faq_index.search(query, settings.FAQ_TOP_K):
+                if score >= settings.FAQ_MIN_SIMILARITY:
+                    scores[position] = min(score, cap)
+        
         query_lower = query.lower()
-        for faq in self.faq_data:
-            keywords = faq.get("keywords", [])
-            if any(keyword.lower() in query_lower for keyword in keywords):
-                return faq["answer"]
+        for position, faq in enumerate(self.faq_data):
+            if any(keyword in query_lower for keyword in faq.keywords_lower):
+                scores[position] = max(scores.get(position, 0.0), settings.FAQ_KEYWORD_SCORE)
+        
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:settings.FAQ_TOP_K]
+        positions = array("I", [position for position, _ in ranked])
+        ranked_scores = array("d", [score for _, score in ranked])
+        self.faq_search_cache.put(
+            key, (positions, ranked_scores),
+            sys.getsizeof(key) + sys.getsizeof(positions) + sys.getsizeof(ranked_scores)
+        )
+        return [(self.faq_data[position], score) for position, score in ranked]
+    
+    def _best_faq_answer(self, faq_matches: List[Tuple[FAQRecord, float]]) -> Optional[str]:
+        """Answer of the top FAQ if it is a confident match"""
+        if faq_matches and faq_matches[0][1] >= settings.FAQ_MATCH_THRESHOLD:
+            return faq_matches[0][0].answer
         return None
     
+    def _format_faq_context(self, faq_matches: List[Tuple[FAQRecord, float]]) -> str:
+        """Ranked FAQ entries for the prompt, most relevant first"""
+        if not faq_matches:
+            return "No specific FAQ match found."
+        return "\n".join(
+            f"{rank}. (relevance {score:.2f}) Q: {faq.question} A: {faq.answer}"
+            for rank, (faq, score) in enumerate(faq_matches, start=1)
+        )
+    
     def _check_escalation_keywords(self, message: str) -> bool:
         """Check if message contains escalation keywords"""
         message_lower = message.lower()
@@ -117,43 +262,38 @@ class LLMService:
             )
         
         # Search FAQ first
-        faq_answer = self._search_faq(user_message)
+        with tracer.span("faq.search") as span:
+            faq_matches = self._search_faq(user_message)
+            span.set_attribute("faq.matches", len(faq_matches))
+        faq_answer = self._best_faq_answer(faq_matches)
         
         if self.use_ai:
             if self.ai_type == "gemini":
-                return await self._generate_gemini_response(user_message, conversation_history, faq_answer)
+                return await self._generate_gemini_response(user_message, conversation_history, faq_answer, faq_matches)
             elif self.ai_type == "openai":
-                return await self._generate_openai_response(user_message, conversation_history, faq_answer)
+                return await self._generate_openai_response(user_message, conversation_history, faq_answer, faq_matches)
         
         return self._generate_mock_response(user_message, faq_answer)
     
-    def _calculate_confidence(self, response: str, faq_match: str) -> float:
-        """Calculate confidence score for the response"""
-        confidence = 0.8  # Base confidence
-        
-        # Higher confidence if FAQ match
-        if faq_match:
-            confidence = 0.95
-        
-        # Lower confidence for uncertainty phrases
-        uncertainty_phrases = [
-            "i'm not sure", "i don't know", "uncertain",
-            "might be", "possibly", "perhaps", "maybe"
-        ]
-        if any(phrase in response.lower() for phrase in uncertainty_phrases):
-            confidence -= 0.3
-        
-        # Lower confidence for very short responses
-        if len(response.split()) < 10:
-            confidence -= 0.1
-        
-        return max(0.0, min(1.0, confidence))
+    def _calculate_confidence(
+        self,
+        response: str,
+        faq_matches: List[Tuple[FAQRecord, float]],
+        conversation_history: List[Dict]
+    ) -> float:
+        """Calculate confidence score for the response with the trained scorer"""
+        retrieval_score = faq_matches[0][1] if faq_matches else 0.0
+        features = extract_features(
+            response, retrieval_score, conversation_history, settings.FAQ_MATCH_THRESHOLD
+        )
+        return self.confidence_scorer.score(features)
     
     async def _generate_gemini_response(
         self,
         user_message: str,
         conversation_history: List[Dict],
-        faq_answer: str
+        faq_answer: str,
+        faq_matches: List[Tuple[FAQRecord, float]]
     ) -> Tuple[str, float, bool]:
         """Generate response using Google Gemini"""
         
@@ -176,7 +316,7 @@ Response Format Guidelines:
 - End with a helpful follow-up question
 - Only suggest contacting human support for account-specific issues or complex technical problems that require personal assistance"""
         
-        faq_context = faq_answer if faq_answer else "No specific FAQ match found."
+        faq_context = self._format_faq_context(faq_matches)
         
         # Build conversation context
         conversation_text = ""
@@ -199,7 +339,7 @@ Support:"""
             response_text = response.strip()
             
             # Calculate confidence score
-            confidence_score = self._calculate_confidence(response_text, faq_answer)
+            confidence_score = self._calculate_confidence(response_text, faq_matches, conversation_history)
             
             # Determine if escalation is needed
             should_escalate = confidence_score < settings.CONFIDENCE_THRESHOLD
@@ -209,6 +349,9 @@ Support:"""
             
             return response_text, confidence_score, should_escalate
             
+        except ReplayMiss:
+            # Strict replay: a missing recording must fail the request, not become a fallback reply
+            raise
         except Exception as e:
             print(f"Error generating Gemini response: {e}")
             return (
@@ -230,13 +373,15 @@ Support:"""
         
         # Run in executor to make it async
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, _sync_call)
+        with tracer.span("llm.gemini.generate_content", **{"llm.model": settings.GEMINI_MODEL, "llm.prompt_chars": len(prompt)}):
+            return await loop.run_in_executor(None, _sync_call)
     
     async def _generate_openai_response(
         self,
         user_message: str,
         conversation_history: List[Dict],
-        faq_answer: str
+        faq_answer: str,
+        faq_matches: List[Tuple[FAQRecord, float]]
     ) -> Tuple[str, float, bool]:
         """Generate response using OpenAI"""
         from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
@@ -253,7 +398,7 @@ FAQ Context: {faq_context}
 
 Be direct and helpful, not vague. Use specific details from FAQ when available."""
         
-        faq_context = faq_answer if faq_answer else "No specific FAQ match found."
+        faq_context = self._format_faq_context(faq_matches)
         
         # Build conversation context
         messages = [
@@ -272,11 +417,12 @@ Be direct and helpful, not vague. Use specific details from FAQ when available."
         
         # Generate response
         try:
-            response = await self.llm.ainvoke(messages)
+            with tracer.span("llm.openai.ainvoke", **{"llm.model": settings.OPENAI_MODEL, "llm.messages": len(messages)}):
+                response = await self.llm.ainvoke(messages)
             response_text = response.content
             
             # Calculate confidence score based on response characteristics
-            confidence_score = self._calculate_confidence(response_text, faq_answer)
+            confidence_score = self._calculate_confidence(response_text, faq_matches, conversation_history)
             
             # Determine if escalation is needed
             should_escalate = confidence_score < settings.CONFIDENCE_THRESHOLD
@@ -286,6 +432,9 @@ Be direct and helpful, not vague. Use specific details from FAQ when available."
             
             return response_text, confidence_score, should_escalate
             
+        except ReplayMiss:
+            # Strict replay: a missing recording must fail the request, not become a fallback reply
+            raise
         except Exception as e:
             print(f"Error generating OpenAI response: {e}")
             return (
@@ -315,7 +464,7 @@ Be direct and helpful, not vague. Use specific details from FAQ when available."
         # Check for keywords in user message
         for keyword, responses in mock_responses.items():
             if keyword in user_lower:
-                response = random.choice(responses)
+                response = _pick(responses, user_message)
                 confidence = 0.8 if len(user_message.split()) > 3 else 0.6
                 should_escalate = confidence < settings.CONFIDENCE_THRESHOLD
                 return response, confidence, should_escalate
@@ -327,7 +476,7 @@ Be direct and helpful, not vague. Use specific details from FAQ when available."
             "Thank you for your message. To provide the best assistance, could you give me more information?",
         ]
         
-        response = random.choice(default_responses)
+        response = _pick(default_responses, user_message)
         confidence = 0.5  # Lower confidence for generic responses
         should_escalate = confidence < settings.CONFIDENCE_THRESHOLD
         
@@ -338,13 +487,14 @@ Be direct and helpful, not vague. Use specific details from FAQ when available."
     
     async def summarize_conversation(self, conversation_history: List[Dict]) -> str:
         """Summarize conversation for escalation"""
-        if self.use_ai:
-            if self.ai_type == "gemini":
-                return await self._summarize_with_gemini(conversation_history)
-            elif self.ai_type == "openai":
-                return await self._summarize_with_openai(conversation_history)
-        
-        return self._summarize_with_mock(conversation_history)
+        with tracer.span("llm.summarize_conversation", **{"conversation.messages": len(conversation_history)}):
+            if self.use_ai:
+                if self.ai_type == "gemini":
+                    return await self._summarize_with_gemini(conversation_history)
+                elif self.ai_type == "openai":
+                    return await self._summarize_with_openai(conversation_history)
+            
+            return self._summarize_with_mock(conversation_history)
     
     async def _summarize_with_gemini(self, conversation_history: List[Dict]) -> str:
         """Summarize using Google Gemini"""
@@ -363,6 +513,8 @@ Summary:"""
         try:
             response = await self._call_gemini_async(prompt)
             return response.strip()
+        except ReplayMiss:
+            raise
         except Exception as e:
             return "Conversation summary unavailable."
     
@@ -383,8 +535,11 @@ highlighting the main issue and any unresolved concerns:
 Summary:"""
         
         try:
-            response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+            with tracer.span("llm.openai.ainvoke", **{"llm.model": settings.OPENAI_MODEL, "llm.messages": 1}):
+                response = await self.llm.ainvoke([HumanMessage(content=prompt)])
             return response.content
+        except ReplayMiss:
+            raise
         except Exception as e:
             return "Conversation summary unavailable."
     
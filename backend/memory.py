@@ -0,0 +1,203 @@
+from collections import OrderedDict
+from types import FunctionType, MethodType, ModuleType
+from typing import Callable, Dict, Hashable, List, Optional, Union
+import os
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from config import get_settings
+
+settings = get_settings()
+
+# Approximate cost of one cache slot beyond key and value (OrderedDict node + (value, size) tuple)
+ENTRY_OVERHEAD = 160
+
+_OPAQUE = (type, ModuleType, FunctionType, MethodType)
+
+
+def deep_sizeof(obj) -> int:
+    """
+    Approximate retained size of an object graph: containers, objects with __dict__ or
+    __slots__, and numpy arrays (by nbytes). Shared objects are counted once; classes,
+    modules and functions are not followed.
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _OPAQUE):
+            continue
+        seen.add(id(current))
+
+        if hasattr(current, "dtype") and hasattr(current, "nbytes"):
+            total += sys.getsizeof(current) + (0 if current.base is None else current.nbytes)
+            continue
+        total += sys.getsizeof(current)
+
+        if isinstance(current, (str, bytes, bytearray, int, float, bool)) or current is None:
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        else:
+            if hasattr(current, "__dict__"):
+                stack.append(current.__dict__)
+            for name in getattr(type(current), "__slots__", ()):
+                if hasattr(current, name):
+                    stack.append(getattr(current, name))
+    return total
+
+
+def process_rss() -> Optional[int]:
+    """Current resident set size of this process, when the platform exposes it"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryBudget:
+    """
+    Byte budget shared by every BoundedCache in the process.
+    When an insert pushes the total over the limit, least-recently-used entries are evicted
+    from whichever cache currently holds the most bytes.
+    """
+
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = limit_bytes
+        self.used_bytes = 0
+        self.caches: List["BoundedCache"] = []
+        self.lock = threading.RLock()
+
+    def enforce(self):
+        while self.used_bytes > self.limit_bytes:
+            victim = max(self.caches, key=lambda cache: cache.nbytes)
+            if not len(victim):
+                break
+            victim._evict_oldest()
+
+
+class BoundedCache:
+    """LRU cache bounded by entry count and by the shared MemoryBudget"""
+
+    def __init__(self, name: str, max_entries: int, budget: Optional[MemoryBudget] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.budget = budget if budget is not None else cache_budget
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        with self.budget.lock:
+            self.budget.caches.append(self)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable):
+        with self.budget.lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value, size: Optional[int] = None):
+        """Insert a value; `size` defaults to deep_sizeof(key) + deep_sizeof(value)"""
+        if self.max_entries <= 0:
+            return
+        if size is None:
+            size = deep_sizeof(key) + deep_sizeof(value)
+        size += ENTRY_OVERHEAD
+        with self.budget.lock:
+            if size > self.budget.limit_bytes:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._release(previous[1])
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            self.budget.used_bytes += size
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+            self.budget.enforce()
+
+    def clear(self):
+        with self.budget.lock:
+            self.budget.used_bytes -= self.nbytes
+            self.nbytes = 0
+            self._entries.clear()
+
+    def _evict_oldest(self):
+        _, (_, size) = self._entries.popitem(last=False)
+        self._release(size)
+        self.evictions += 1
+
+    def _release(self, size: int):
+        self.nbytes -= size
+        self.budget.used_bytes -= size
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class MemoryAccountant:
+    """Per-component memory report for this worker (served by /api/health)"""
+
+    def __init__(self, budget: MemoryBudget):
+        self.budget = budget
+        self._components: Dict[str, Callable[[], int]] = {}
+
+    def register(self, component: str, size: Union[int, Callable[[], int]]):
+        """Track a component by a fixed size (static data) or a callable (live structures)"""
+        self._components[component] = size if callable(size) else (lambda: size)
+
+    def snapshot(self) -> Dict:
+        components = {name: int(size()) for name, size in self._components.items()}
+        with self.budget.lock:
+            caches = {cache.name: cache.stats() for cache in self.budget.caches}
+            cache_bytes = self.budget.used_bytes
+        tracked = sum(components.values()) + cache_bytes
+        rss = process_rss()
+        return {
+            "pid": os.getpid(),
+            "rss_bytes": rss,
+            "peak_rss_bytes": peak_rss(),
+            "tracked_bytes": tracked,
+            "untracked_bytes": rss - tracked if rss is not None else None,
+            "cache_budget_bytes": self.budget.limit_bytes,
+            "cache_bytes": cache_bytes,
+            "components": components,
+            "caches": caches,
+        }
+
+
+cache_budget = MemoryBudget(int(settings.MEMORY_CACHE_BUDGET_MB * 1024 * 1024))
+accountant = MemoryAccountant(cache_budget)
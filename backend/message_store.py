@@ -0,0 +1,207 @@
+from typing import List, Tuple
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import compression
+from config import get_settings
+from models import ChatSession, Message, MessageContent, CompressionDictionary, MessageRole
+
+settings = get_settings()
+
+FAQ_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "faqs.json")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _faq_dictionary_samples() -> List[str]:
+    """FAQ answers are the most repeated assistant text, so they seed the shared dictionary"""
+    try:
+        with open(FAQ_PATH, "r") as f:
+            faqs = json.load(f).get("faqs", [])
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+    return [faq["answer"] for faq in faqs if faq.get("answer")]
+
+
+async def fetch_transcript(db: AsyncSession, session_id: str) -> List[Tuple]:
+    """
+    Load (role, content, confidence_score, timestamp) rows for a session, oldest first.
+    Selects plain columns instead of ORM entities, so no identity-map bookkeeping is done.
+    """
+    result = await db.execute(
+        select(
+            Message.role,
+            Message.stored_content,
+            MessageContent.body,
+            Message.confidence_score,
+            Message.timestamp
+        )
+        .outerjoin(MessageContent, Message.content_hash == MessageContent.content_hash)
+        .where(Message.session_id == session_id)
+        .order_by(Message.timestamp)
+    )
+    return [
+        (role, shared_body if shared_body is not None else stored, confidence_score, timestamp)
+        for role, stored, shared_body, confidence_score, timestamp in result
+    ]
+
+
+async def load_dictionaries(db: AsyncSession):
+    """
+    Register every stored compression dictionary for decoding.
+    In compact mode a dictionary is built from the FAQ answers on first use.
+    """
+    result = await db.execute(
+        select(CompressionDictionary).order_by(CompressionDictionary.created_at)
+    )
+    dictionaries = result.scalars().all()
+    for dictionary in dictionaries:
+        compression.register_dictionary(dictionary.data)
+
+    if dictionaries or not compression.is_compact():
+        return
+
+    samples = _faq_dictionary_samples()
+    if not samples:
+        return
+
+    data = compression.build_dictionary(samples)
+    dictionary_id = compression.register_dictionary(data)
+    await db.execute(
+        sqlite_insert(CompressionDictionary)
+        .values(dictionary_id=dictionary_id, data=data)
+        .on_conflict_do_nothing(index_elements=["dictionary_id"])
+    )
+    await db.commit()
+
+
+async def store_shared_content(db: AsyncSession, text: str) -> str:
+    """Insert a body into the content table if missing; returns its hash"""
+    digest = content_hash(text)
+    await db.execute(
+        sqlite_insert(MessageContent)
+        .values(content_hash=digest, body=text)
+        .on_conflict_do_nothing(index_elements=["content_hash"])
+    )
+    return digest
+
+
+def should_dedupe(role: MessageRole, text: str) -> bool:
+    return compression.is_compact() and role == MessageRole.ASSISTANT and len(text) >= settings.DEDUPE_MIN_BYTES
+
+
+async def dedupe_content(db: AsyncSession, message: Message):
+    """
+    Store a long message body once in the content table and point the message at it.
+    No-op in plain storage mode or for short bodies.
+    """
+    text = message.content
+    if not should_dedupe(message.role, text):
+        return
+
+    digest = await store_shared_content(db, text)
+    message.content_ref = await db.get(MessageContent, digest)
+    message.content_hash = digest
+    message.stored_content = ""
+
+
+async def migrate(db: AsyncSession, mode: str, batch_size: int = 500) -> int:
+    """
+    Rewrite every message and session row in the given storage mode.
+    Rows are read through the decoding types, so the source format does not matter.
+    """
+    compression.set_storage_mode(mode)
+    await load_dictionaries(db)
+
+    migrated = 0
+    last_id = 0
+    while True:
+        result = await db.execute(
+            select(Message).where(Message.id > last_id).order_by(Message.id).limit(batch_size)
+        )
+        messages = result.scalars().all()
+        if not messages:
+            break
+
+        for message in messages:
+            text = message.content
+            values = {Message.role: message.role, Message.stored_content: text, Message.content_hash: None}
+
+            if should_dedupe(message.role, text):
+                digest = await store_shared_content(db, text)
+                values.update({Message.stored_content: "", Message.content_hash: digest})
+
+            await db.execute(
+                update(Message)
+                .where(Message.id == message.id)
+                .values(values)
+                .execution_options(synchronize_session=False)
+            )
+
+        last_id = messages[-1].id
+        migrated += len(messages)
+        await db.commit()
+        db.expunge_all()
+
+    sessions = (await db.execute(select(ChatSession.id, ChatSession.status))).all()
+    for session_pk, status in sessions:
+        await db.execute(
+            update(ChatSession)
+            .where(ChatSession.id == session_pk)
+            .values(status=status)
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+
+    return migrated
+
+
+async def storage_stats(db: AsyncSession) -> dict:
+    """Row counts for the message storage tables"""
+    messages = await db.scalar(select(func.count(Message.id)))
+    deduplicated = await db.scalar(select(func.count(Message.id)).where(Message.content_hash.is_not(None)))
+    contents = await db.scalar(select(func.count(MessageContent.content_hash)))
+    return {
+        "messages": messages,
+        "deduplicated_messages": deduplicated,
+        "shared_contents": contents,
+        "storage_mode": compression.get_storage_mode(),
+    }
+
+
+async def _main():
+    from database import async_session_factory, init_db, close_db
+
+    parser = argparse.ArgumentParser(description="Migrate message storage between plain and compact modes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="rewrite all rows in the target storage mode")
+    migrate_parser.add_argument("--to", dest="mode", required=True,
+                                choices=[compression.STORAGE_PLAIN, compression.STORAGE_COMPACT])
+    migrate_parser.add_argument("--batch-size", type=int, default=500)
+    subparsers.add_parser("stats", help="show message storage statistics")
+    args = parser.parse_args()
+
+    await init_db()
+    async with async_session_factory() as db:
+        if args.command == "migrate":
+            count = await migrate(db, args.mode, args.batch_size)
+            print(f"[OK] Migrated {count} messages to {args.mode} storage")
+            print("   Run VACUUM on the database file to reclaim freed pages")
+        else:
+            await load_dictionaries(db)
+            for key, value in (await storage_stats(db)).items():
+                print(f"{key}: {value}")
+    await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
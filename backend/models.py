@@ -1,9 +1,11 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Float, Text, ForeignKey, Enum, UniqueConstraint, LargeBinary, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
 
+from compression import CompressedText, CompactEnum
+
 Base = declarative_base()
 
 class SessionStatus(str, enum.Enum):
@@ -21,13 +23,26 @@ class EscalationTrigger(str, enum.Enum):
     AI_INITIATED = "ai_initiated"
     BUSINESS_DRIVEN = "business_driven"
 
+# Stable codes used by compact storage mode, stored as one-character text (never renumber)
+SESSION_STATUS_CODES = {
+    SessionStatus.ACTIVE: 1,
+    SessionStatus.ESCALATED: 2,
+    SessionStatus.CLOSED: 3,
+}
+
+MESSAGE_ROLE_CODES = {
+    MessageRole.USER: 1,
+    MessageRole.ASSISTANT: 2,
+    MessageRole.SYSTEM: 3,
+}
+
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String(36), unique=True, index=True, nullable=False)
     user_id = Column(String(100), nullable=True)
-    status = Column(Enum(SessionStatus), default=SessionStatus.ACTIVE)
+    status = Column(CompactEnum(SessionStatus, SESSION_STATUS_CODES), default=SessionStatus.ACTIVE)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -39,12 +54,48 @@ class Message(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String(36), ForeignKey("chat_sessions.session_id"), nullable=False)
-    role = Column(Enum(MessageRole), nullable=False)
-    content = Column(Text, nullable=False)
+    role = Column(CompactEnum(MessageRole, MESSAGE_ROLE_CODES), nullable=False)
+    stored_content = Column("content", CompressedText, nullable=False)
+    content_hash = Column(String(64), ForeignKey("message_contents.content_hash"), nullable=True)
     confidence_score = Column(Float, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
     
     session = relationship("ChatSession", back_populates="messages")
+    content_ref = relationship("MessageContent", lazy="joined")
+    
+    # Every transcript read filters by session and orders by time
+    __table_args__ = (
+        Index("ix_messages_session_timestamp", "session_id", "timestamp"),
+    )
+    
+    @property
+    def content(self) -> str:
+        """Message text, resolved through the shared content table when deduplicated"""
+        if self.content_hash is not None:
+            return self.content_ref.body
+        return self.stored_content
+    
+    @content.setter
+    def content(self, value: str):
+        self.stored_content = value
+        self.content_hash = None
+        self.content_ref = None
+
+class MessageContent(Base):
+    """Content-addressed message body shared by repeated assistant replies"""
+    __tablename__ = "message_contents"
+    
+    content_hash = Column(String(64), primary_key=True)
+    body = Column(CompressedText, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CompressionDictionary(Base):
+    """Shared compression dictionary; kept forever so old rows stay decodable"""
+    __tablename__ = "compression_dictionaries"
+    
+    dictionary_id = Column(Integer, primary_key=True, autoincrement=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class Escalation(Base):
     __tablename__ = "escalations"
@@ -57,3 +108,28 @@ class Escalation(Base):
     agent_id = Column(String(100), nullable=True)
     
     session = relationship("ChatSession", back_populates="escalations")
+
+class MetricRollup(Base):
+    """Pre-aggregated metric bucket, maintained on write for analytics endpoints"""
+    __tablename__ = "metric_rollups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    metric = Column(String(50), nullable=False)
+    granularity = Column(String(10), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    dimension = Column(String(50), nullable=False, default="")
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+    
+    # Leading columns match the analytics range query: metric + granularity + time window
+    __table_args__ = (
+        UniqueConstraint("metric", "granularity", "bucket_start", "dimension", name="uq_metric_rollup_bucket"),
+    )
+
+class WriteBehindCheckpoint(Base):
+    """Highest write-behind log sequence committed to the database, per log file"""
+    __tablename__ = "write_behind_checkpoints"
+    
+    log_name = Column(String(255), primary_key=True)
+    last_sequence = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,242 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+import json
+import os
+import random
+import threading
+import time
+
+from config import get_settings
+
+settings = get_settings()
+
+# OpenTelemetry status codes
+STATUS_UNSET = "UNSET"
+STATUS_OK = "OK"
+STATUS_ERROR = "ERROR"
+
+
+class Span:
+    """A timed operation; fields follow the OpenTelemetry span data model"""
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "start_time_unix_nano",
+                 "end_time_unix_nano", "attributes", "status", "status_message", "sampled")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str], sampled: bool):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_span_id = parent_span_id
+        self.start_time_unix_nano = time.time_ns()
+        self.end_time_unix_nano = 0
+        self.attributes: Dict = {}
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        self.sampled = sampled
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "startTimeUnixNano": self.start_time_unix_nano,
+            "endTimeUnixNano": self.end_time_unix_nano,
+            "attributes": self.attributes,
+            "status": {"code": self.status, "message": self.status_message},
+        }
+
+
+class _NoopSpan:
+    """Shared stand-in when tracing is disabled or the trace is not sampled"""
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class InMemorySpanExporter:
+    """Collects finished spans in memory (for tests and debugging)"""
+
+    def __init__(self):
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+
+    def get_finished_spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def shutdown(self):
+        pass
+
+
+class FileSpanExporter:
+    """Appends finished spans to a local file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def shutdown(self):
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    """
+    Minimal tracer with parent/child propagation through contextvars.
+    The sampling decision is made once per trace at the root span; when tracing is
+    disabled `span()` yields a shared no-op object without allocating anything.
+    """
+
+    def __init__(self, enabled: bool = False, sample_rate: float = 1.0, exporter=None):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self._current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+    def configure(self, enabled: bool, sample_rate: float = 1.0, exporter=None):
+        if self.exporter is not None and self.exporter is not exporter:
+            self.exporter.shutdown()
+        self.enabled = enabled and exporter is not None
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    def current_span(self) -> Optional[Span]:
+        return self._current.get()
+
+    def _new_span(self, name: str, attributes: Dict, traceparent: Optional[str] = None) -> Span:
+        parent = self._current.get()
+        remote = _parse_traceparent(traceparent) if traceparent and parent is None else None
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, parent.sampled)
+        elif remote is not None:
+            span = Span(name, remote[0], remote[1], remote[2])
+        else:
+            trace_id = "%032x" % random.getrandbits(128)
+            span = Span(name, trace_id, None, random.random() < self.sample_rate)
+        span.attributes.update(attributes)
+        return span
+
+    def _end(self, span: Span, error: Optional[BaseException] = None):
+        if error is not None:
+            span.status = STATUS_ERROR
+            span.status_message = f"{type(error).__name__}: {error}"
+        if span.sampled:
+            span.end_time_unix_nano = time.time_ns()
+            self.exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, traceparent: Optional[str] = None, **attributes):
+        """Run a block inside a child of the current span (or a new trace)"""
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+
+        span = self._new_span(name, attributes, traceparent)
+        token = self._current.set(span)
+        try:
+            yield span if span.sampled else _NOOP_SPAN
+        except BaseException as error:
+            self._current.reset(token)
+            self._end(span, error)
+            raise
+        self._current.reset(token)
+        self._end(span)
+
+    def start_leaf_span(self, name: str, **attributes) -> Optional[Span]:
+        """
+        Start a span that never becomes current, for callbacks that cannot wrap a block
+        (e.g. SQLAlchemy cursor events). Returns None when nothing will be recorded.
+        """
+        if not self.enabled:
+            return None
+        parent = self._current.get()
+        if parent is not None and not parent.sampled:
+            return None
+        span = self._new_span(name, attributes)
+        return span if span.sampled else None
+
+    def end_leaf_span(self, span: Optional[Span], error: Optional[BaseException] = None):
+        if span is not None:
+            self._end(span, error)
+
+
+def _parse_traceparent(header: str):
+    """Parse a W3C traceparent header into (trace_id, parent_span_id, sampled)"""
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def _build_exporter():
+    exporter = settings.TRACING_EXPORTER.lower()
+    if exporter == "memory":
+        return InMemorySpanExporter()
+    if exporter == "file":
+        directory = os.path.dirname(settings.TRACING_FILE)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return FileSpanExporter(settings.TRACING_FILE)
+    return None
+
+
+class TraceRequestsMiddleware:
+    """
+    Root span per HTTP request, continuing a W3C traceparent from the caller when present.
+    Plain ASGI middleware, so a disabled tracer adds one flag check per request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        method, path = scope["method"], scope["path"]
+        with tracer.span(
+            f"{method} {path}", traceparent=traceparent, **{"http.method": method, "http.target": path}
+        ) as span:
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                await send(message)
+
+            await self.app(scope, receive, send_with_status)
+
+
+tracer = Tracer()
+if settings.TRACING_ENABLED:
+    tracer.configure(True, settings.TRACING_SAMPLE_RATE, _build_exporter())
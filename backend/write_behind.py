@@ -0,0 +1,446 @@
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import itertools
+import json
+import os
+import sys
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from sqlalchemy import select, update, insert, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import analytics
+import message_store
+from models import ChatSession, Message, MessageRole, WriteBehindCheckpoint
+from serialization import dumps
+from tracing import tracer
+
+# Approximate size of a PendingMessage beyond its content string (slots object, timestamp, index entries)
+MESSAGE_OVERHEAD = 300
+
+# (role, content, confidence_score, timestamp), as returned by message_store.fetch_transcript
+TranscriptRow = Tuple[MessageRole, str, Optional[float], datetime]
+
+
+class PendingMessage:
+    """A chat message accepted by the API but not yet committed to the database"""
+    __slots__ = ("sequence", "session_id", "role", "content", "confidence_score", "timestamp")
+
+    def __init__(
+        self,
+        sequence: int,
+        session_id: str,
+        role: MessageRole,
+        content: str,
+        confidence_score: Optional[float],
+        timestamp: datetime
+    ):
+        self.sequence = sequence
+        self.session_id = session_id
+        self.role = role
+        self.content = content
+        self.confidence_score = confidence_score
+        self.timestamp = timestamp
+
+    def to_log(self) -> bytes:
+        return dumps({
+            "seq": self.sequence,
+            "session_id": self.session_id,
+            "role": self.role.value,
+            "content": self.content,
+            "confidence_score": self.confidence_score,
+            "timestamp": self.timestamp,
+        }) + b"\n"
+
+    @classmethod
+    def from_log(cls, line: bytes) -> "PendingMessage":
+        data = json.loads(line)
+        return cls(
+            data["seq"],
+            data["session_id"],
+            MessageRole(data["role"]),
+            data["content"],
+            data["confidence_score"],
+            datetime.fromisoformat(data["timestamp"])
+        )
+
+    def as_transcript_row(self) -> TranscriptRow:
+        return self.role, self.content, self.confidence_score, self.timestamp
+
+
+def merge_transcript(transcript: List[TranscriptRow], pending: List[PendingMessage]) -> List[TranscriptRow]:
+    """
+    Append queued messages to a stored transcript, skipping any the flusher committed
+    between the snapshot and the query (matched on timestamp and role).
+    """
+    if not pending:
+        return transcript
+    stored = {(timestamp, role) for role, _, _, timestamp in transcript}
+    merged = transcript + [
+        message.as_transcript_row() for message in pending
+        if (message.timestamp, message.role) not in stored
+    ]
+    merged.sort(key=lambda row: row[3])
+    return merged
+
+
+class WriteBehindQueue:
+    """
+    Write-behind buffer for chat messages.
+
+    `append` writes each message to an append-only log and an in-memory buffer and returns
+    without touching the database. A background task bulk-inserts the buffer in batches,
+    bumps `ChatSession.updated_at`, maintains the analytics rollups and advances a
+    checkpoint row in the same transaction. On startup, log entries above the checkpoint
+    are replayed, so a crash loses nothing that reached the log and never inserts twice.
+    Readers take a `snapshot` before querying and `merge_transcript` afterwards to see
+    their own unflushed writes.
+
+    Each log and its checkpoint belong to one process. `start` claims the first free slot
+    (`log_path`, then `<root>.1<ext>`, `<root>.2<ext>`, ...) by taking an exclusive lock on
+    `<slot>.lock`, so workers sharing one configuration get their own logs. Unclaimed slots
+    left by a previous, larger set of workers are flushed on start.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        log_path: str = "",
+        fsync: bool = False,
+        batch_size: int = 500,
+        flush_interval: float = 0.2,
+        max_pending: int = 10000,
+        compact_bytes: int = 8 * 1024 * 1024,
+        slots: int = 64
+    ):
+        self.session_factory = session_factory
+        self.base_log_path = os.path.abspath(log_path) if log_path else ""
+        # The claimed slot once started
+        self.log_path = self.base_log_path
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.compact_bytes = compact_bytes
+        self.slots = slots
+
+        self._pending: Dict[int, PendingMessage] = {}
+        self._by_session: Dict[str, List[PendingMessage]] = {}
+        self._sequence = itertools.count(1)
+        self._log = None
+        self._log_bytes = 0
+        self._lock_file = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        # Serializes log appends with compaction, which swaps the file from a worker thread
+        self._log_lock = asyncio.Lock()
+        self._flushed = 0
+        self._batches = 0
+        self._failures = 0
+        self._stopping = False
+        self.pending_bytes = 0
+
+    # Lifecycle
+
+    async def start(self):
+        """Claim a log slot, replay its unflushed entries and start the background flusher"""
+        self._acquire_log_lock()
+        try:
+            replayed = await self._replay()
+        except BaseException:
+            self._release_log_lock()
+            raise
+        if replayed:
+            print(f"[OK] Replayed {replayed} unflushed messages from the write-behind log {self.log_path}")
+        self._task = asyncio.create_task(self._run())
+        await self._flush_orphaned_slots()
+
+    async def stop(self):
+        """Flush everything still buffered and close the log"""
+        if self._task is not None:
+            # Let an in-flight flush finish rather than cancelling it between commit and bookkeeping
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        try:
+            while self._pending:
+                await self.flush()
+        except Exception as e:
+            # Entries stay in the log and are replayed on the next start
+            print(f"[WARNING] Write-behind final flush failed: {e}")
+        if self._log is not None:
+            self._rewrite_log()
+            self._log.close()
+            self._log = None
+        self._release_log_lock()
+
+    @asynccontextmanager
+    async def paused(self):
+        """Hold off flushes, e.g. while deleting a session, so none commits rows for it concurrently"""
+        async with self._flush_lock:
+            yield
+
+    def _slot_path(self, slot: int) -> str:
+        if slot == 0:
+            return self.base_log_path
+        root, extension = os.path.splitext(self.base_log_path)
+        return f"{root}.{slot}{extension}"
+
+    def _acquire_log_lock(self):
+        """Lock the first free slot and make it this queue's log"""
+        if not self.base_log_path or fcntl is None:
+            return
+        os.makedirs(os.path.dirname(self.base_log_path), exist_ok=True)
+        for slot in range(self.slots):
+            path = self._slot_path(slot)
+            # The log is rewritten with os.replace, so lock a sidecar file whose inode never changes
+            lock_file = open(path + ".lock", "a")
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                continue
+            self._lock_file = lock_file
+            self.log_path = path
+            return
+        raise RuntimeError(
+            f"All {self.slots} write-behind log slots of {self.base_log_path} are in use by other processes"
+        )
+
+    def _release_log_lock(self):
+        if self._lock_file is not None:
+            # Closing the descriptor drops the flock
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def _flush_orphaned_slots(self):
+        """Commit entries left in slots no running worker holds (e.g. after scaling down)"""
+        if not self.base_log_path or fcntl is None:
+            return
+        for slot in range(self.slots):
+            path = self._slot_path(slot)
+            if path == self.log_path or not os.path.exists(path) or not os.path.getsize(path):
+                continue
+            orphan = WriteBehindQueue(self.session_factory, path, batch_size=self.batch_size, slots=1)
+            try:
+                await orphan.start()
+            except RuntimeError:
+                # Held by a live worker
+                continue
+            await orphan.stop()
+
+    async def _replay(self) -> int:
+        if not self.log_path:
+            return 0
+
+        async with self.session_factory() as db:
+            checkpoint = await db.get(WriteBehindCheckpoint, self.log_path)
+        last_sequence = checkpoint.last_sequence if checkpoint else 0
+        highest = last_sequence
+
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    try:
+                        message = PendingMessage.from_log(line)
+                    except (ValueError, KeyError):
+                        # Torn final write from a crash
+                        continue
+                    highest = max(highest, message.sequence)
+                    if message.sequence > last_sequence:
+                        self._buffer(message)
+
+        self._sequence = itertools.count(highest + 1)
+        self._rewrite_log()
+        return len(self._pending)
+
+    # Writes
+
+    def _buffer(self, message: PendingMessage):
+        self._pending[message.sequence] = message
+        self._by_session.setdefault(message.session_id, []).append(message)
+        self.pending_bytes += sys.getsizeof(message.content) + MESSAGE_OVERHEAD
+
+    def _unbuffer(self, message: PendingMessage):
+        if self._pending.pop(message.sequence, None) is not None:
+            self.pending_bytes -= sys.getsizeof(message.content) + MESSAGE_OVERHEAD
+
+    async def append(
+        self,
+        session_id: str,
+        messages: List[Tuple[MessageRole, str, Optional[float], datetime]]
+    ) -> List[PendingMessage]:
+        """Durably queue (role, content, confidence_score, timestamp) messages for a session"""
+        if len(self._pending) >= self.max_pending:
+            # Backpressure: wait for the flusher rather than growing without bound
+            await self.flush()
+
+        queued = [
+            PendingMessage(next(self._sequence), session_id, role, content, confidence_score, timestamp)
+            for role, content, confidence_score, timestamp in messages
+        ]
+        if self._log is not None:
+            data = b"".join(message.to_log() for message in queued)
+            async with self._log_lock:
+                self._log.write(data)
+                self._log.flush()
+                if self.fsync:
+                    os.fsync(self._log.fileno())
+                self._log_bytes += len(data)
+
+        for message in queued:
+            self._buffer(message)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return queued
+
+    def snapshot(self, session_id: str) -> List[PendingMessage]:
+        """Unflushed messages for a session; take this before querying the database"""
+        return list(self._by_session.get(session_id, ()))
+
+    def discard(self, session_id: str):
+        """Drop queued messages of a deleted session"""
+        for message in self._by_session.pop(session_id, ()):
+            self._unbuffer(message)
+
+    # Flushing
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                # Messages arriving mid-flush wait for the next tick unless a full batch is ready
+                while len(self._pending) >= self.batch_size:
+                    await self.flush()
+            except Exception as e:
+                # Keep the buffer and retry on the next tick
+                self._failures += 1
+                print(f"[WARNING] Write-behind flush failed: {e}")
+
+    async def flush(self) -> int:
+        """Commit up to one batch of queued messages; returns how many were written"""
+        async with self._flush_lock:
+            batch = list(itertools.islice(self._pending.values(), self.batch_size))
+            if not batch:
+                return 0
+
+            with tracer.span("write_behind.flush", **{"write_behind.batch_size": len(batch)}):
+                async with self.session_factory() as db:
+                    session_ids = {message.session_id for message in batch}
+                    existing = set((await db.execute(
+                        select(ChatSession.session_id).where(ChatSession.session_id.in_(session_ids))
+                    )).scalars())
+
+                    rows, events = [], []
+                    latest: Dict[str, datetime] = {}
+                    for message in batch:
+                        # Sessions deleted after their messages were queued
+                        if message.session_id not in existing:
+                            continue
+                        row = {
+                            "session_id": message.session_id,
+                            "role": message.role,
+                            "content": message.content,
+                            "content_hash": None,
+                            "confidence_score": message.confidence_score,
+                            "timestamp": message.timestamp,
+                        }
+                        if message_store.should_dedupe(message.role, message.content):
+                            row["content_hash"] = await message_store.store_shared_content(db, message.content)
+                            row["content"] = ""
+                        rows.append(row)
+                        events.extend(analytics.message_events(
+                            message.role, message.confidence_score, message.timestamp
+                        ))
+                        latest[message.session_id] = max(latest.get(message.session_id, message.timestamp),
+                                                         message.timestamp)
+
+                    if rows:
+                        await db.execute(insert(Message.__table__), rows)
+                    for session_id, timestamp in latest.items():
+                        await db.execute(
+                            update(ChatSession.__table__)
+                            .where(ChatSession.session_id == session_id)
+                            # Never move the timestamp backwards (e.g. past a synchronous escalation)
+                            .values(updated_at=func.max(func.coalesce(ChatSession.updated_at, timestamp), timestamp))
+                        )
+                    await analytics.record_metrics(db, events)
+
+                    if self.log_path:
+                        stmt = sqlite_insert(WriteBehindCheckpoint).values(
+                            log_name=self.log_path,
+                            last_sequence=batch[-1].sequence,
+                            updated_at=datetime.utcnow()
+                        )
+                        await db.execute(stmt.on_conflict_do_update(
+                            index_elements=["log_name"],
+                            set_={"last_sequence": stmt.excluded.last_sequence,
+                                  "updated_at": stmt.excluded.updated_at}
+                        ))
+                    await db.commit()
+
+                    # Bookkeeping right after the commit, with no await in between
+                    for message in batch:
+                        self._unbuffer(message)
+                        remaining = self._by_session.get(message.session_id)
+                        if remaining and remaining[0] is message:
+                            remaining.pop(0)
+                            if not remaining:
+                                del self._by_session[message.session_id]
+                    self._flushed += len(rows)
+                    self._batches += 1
+
+            if self._log is not None:
+                if not self._pending:
+                    # Every entry is at or below the checkpoint, so replay would skip them all anyway
+                    async with self._log_lock:
+                        self._log.truncate(0)
+                        self._log_bytes = 0
+                elif self._log_bytes > self.compact_bytes:
+                    async with self._log_lock:
+                        await asyncio.to_thread(self._rewrite_log, list(self._pending.values()))
+            return len(batch)
+
+    def _rewrite_log(self, messages: Optional[List[PendingMessage]] = None):
+        """Atomically replace the log with only the given (by default the still-pending) entries"""
+        if not self.log_path:
+            return
+        if messages is None:
+            messages = list(self._pending.values())
+        if self._log is not None:
+            self._log.close()
+        directory = os.path.dirname(self.log_path)
+        os.makedirs(directory, exist_ok=True)
+        temporary = self.log_path + ".tmp"
+        with open(temporary, "wb") as f:
+            for message in messages:
+                f.write(message.to_log())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.log_path)
+        self._log = open(self.log_path, "ab")
+        self._log_bytes = self._log.tell()
+
+    def stats(self) -> Dict:
+        return {
+            "pending": len(self._pending),
+            "pending_sessions": len(self._by_session),
+            "pending_bytes": self.pending_bytes,
+            "flushed": self._flushed,
+            "batches": self._batches,
+            "failed_flushes": self._failures,
+            "log_bytes": self._log_bytes,
+        }
@@ -0,0 +1,138 @@
+"""
+Benchmark /api/chat/history serialization on long transcripts.
+
+Compares the previous path (ORM entities -> Pydantic models -> response_model
+validation -> jsonable_encoder -> json) with the Core select + FastJSONResponse path,
+and times the full endpoint through the ASGI app.
+
+Usage (from the repository root):
+    python benchmarks/bench_history.py --messages 1000 --iterations 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_history_"), "bench.db")
+
+# Settings are read at import time, so configure them before importing the backend
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_PATH}"
+os.environ["DEBUG"] = "False"
+os.environ["AI_PROVIDER"] = "mock"
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+import httpx  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+import message_store  # noqa: E402
+from app import app, ConversationHistoryResponse, MessageResponse  # noqa: E402
+from database import async_session_factory, init_db, close_db  # noqa: E402
+from models import ChatSession, Message, MessageRole, SessionStatus  # noqa: E402
+from serialization import FastJSONResponse, orjson  # noqa: E402
+
+SESSION_ID = "bench-history"
+
+
+async def populate(messages: int):
+    async with async_session_factory() as db:
+        db.add(ChatSession(session_id=SESSION_ID, status=SessionStatus.ACTIVE))
+        for i in range(messages):
+            role = MessageRole.USER if i % 2 == 0 else MessageRole.ASSISTANT
+            db.add(Message(
+                session_id=SESSION_ID,
+                role=role,
+                content=f"Message {i}: " + "lorem ipsum dolor sit amet " * 12,
+                confidence_score=0.9 if role == MessageRole.ASSISTANT else None
+            ))
+        await db.commit()
+
+
+async def legacy_path() -> bytes:
+    async with async_session_factory() as db:
+        session = (await db.execute(
+            select(ChatSession).where(ChatSession.session_id == SESSION_ID)
+        )).scalar_one()
+        messages = (await db.execute(
+            select(Message).where(Message.session_id == SESSION_ID).order_by(Message.timestamp)
+        )).scalars().all()
+        model = ConversationHistoryResponse(
+            session_id=session.session_id,
+            status=session.status.value,
+            messages=[
+                MessageResponse(
+                    role=msg.role.value,
+                    content=msg.content,
+                    confidence_score=msg.confidence_score,
+                    timestamp=msg.timestamp
+                )
+                for msg in messages
+            ]
+        )
+        # What FastAPI does with a returned model and a response_model
+        validated = ConversationHistoryResponse.model_validate(model.model_dump())
+        return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+async def fast_path() -> bytes:
+    async with async_session_factory() as db:
+        session = (await db.execute(
+            select(ChatSession.session_id, ChatSession.status).where(ChatSession.session_id == SESSION_ID)
+        )).first()
+        transcript = await message_store.fetch_transcript(db, SESSION_ID)
+        return FastJSONResponse({
+            "session_id": session.session_id,
+            "status": session.status.value,
+            "messages": [
+                {"role": role.value, "content": content,
+                 "confidence_score": confidence_score, "timestamp": timestamp}
+                for role, content, confidence_score, timestamp in transcript
+            ]
+        }).body
+
+
+async def timed(label: str, func, iterations: int) -> float:
+    await func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    elapsed_ms = (time.perf_counter() - start) * 1000 / iterations
+    print(f"{label:<28}{elapsed_ms:>10.2f} ms")
+    return elapsed_ms
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    await init_db()
+    await populate(args.messages)
+
+    legacy = json.loads(await legacy_path())
+    fast = json.loads(await fast_path())
+    assert len(legacy["messages"]) == len(fast["messages"]) == args.messages
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def endpoint():
+            response = await client.get(f"/api/chat/history/{SESSION_ID}")
+            response.raise_for_status()
+
+        print(f"{args.messages}-message history, {args.iterations} iterations "
+              f"(encoder: {'orjson' if orjson is not None else 'json'})")
+        legacy_ms = await timed("ORM + Pydantic (previous)", legacy_path, args.iterations)
+        fast_ms = await timed("Core select + fast JSON", fast_path, args.iterations)
+        await timed("GET /api/chat/history", endpoint, args.iterations)
+        print(f"speedup: {legacy_ms / fast_ms:.1f}x")
+
+    await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
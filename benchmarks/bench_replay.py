@@ -0,0 +1,143 @@
+"""
+End-to-end chat benchmark over recorded provider traffic.
+
+Drives a fixed set of scripted conversations through the ASGI app with bounded concurrency
+and reports per-message latency, throughput and a digest of every reply. In `record` mode
+the real provider (RECORDING_PROVIDER, API key from .env) answers and each call is captured to
+the recording; in `replay` mode the same code path is served from the recording with no
+network, so the digest is identical on every run and latency follows the recorded
+distribution (scaled by --latency-scale).
+
+Usage (from the repository root):
+    python benchmarks/bench_replay.py --mode record --recording recordings/llm.jsonl   # once, online
+    python benchmarks/bench_replay.py --mode replay --recording recordings/llm.jsonl   # offline / CI
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPTS = [
+    ["Hi, I need some help", "How do I reset my password?", "The reset email never arrived"],
+    ["What is your refund policy?", "Can I return an opened item?", "How long does the refund take?"],
+    ["Where is my order?", "It has been two weeks", "Can you check the tracking number?"],
+    ["Do you ship internationally?", "How much is shipping to Canada?"],
+    ["My app keeps crashing with an error", "I already reinstalled it", "It happens on startup"],
+    ["How do I change my subscription plan?", "Will I be charged immediately?", "thanks, bye"],
+]
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(args):
+    import httpx
+    import app as app_module
+
+    await app_module.startup_event()
+    latencies = []
+    transcripts = {}
+    failures = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    # Server errors (e.g. strict replay misses) come back as 500s instead of aborting the run
+    transport = httpx.ASGITransport(app=app_module.app, raise_app_exceptions=False)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        async def conversation(index: int):
+            async with semaphore:
+                script = SCRIPTS[index % len(SCRIPTS)]
+                session_id = (await client.post("/api/chat/create", json={})).json()["session_id"]
+                replies = []
+                for message in script:
+                    start = time.perf_counter()
+                    response = await client.post(
+                        "/api/chat/message", json={"session_id": session_id, "message": message}
+                    )
+                    latencies.append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        failures.append(f"session {index} message {message!r}: HTTP {response.status_code}")
+                        replies.append(f"HTTP {response.status_code}")
+                        continue
+                    replies.append(response.json()["response"])
+                if args.escalate:
+                    response = await client.post("/api/chat/escalate", json={"session_id": session_id})
+                    if response.status_code != 200:
+                        failures.append(f"session {index} escalation: HTTP {response.status_code}")
+                        replies.append(f"HTTP {response.status_code}")
+                    else:
+                        replies.append(response.json()["summary"])
+                transcripts[index] = replies
+
+        start = time.perf_counter()
+        await asyncio.gather(*(conversation(i) for i in range(args.sessions)))
+        elapsed = time.perf_counter() - start
+
+    digest = hashlib.sha256()
+    for index in sorted(transcripts):
+        for reply in transcripts[index]:
+            digest.update(reply.encode("utf-8") + b"\0")
+
+    print(f"{args.mode}: {args.sessions} sessions, {len(latencies)} messages, concurrency {args.concurrency}")
+    print(f"latency p50 {percentile(latencies, 0.50) * 1000:>9.1f} ms")
+    print(f"latency p95 {percentile(latencies, 0.95) * 1000:>9.1f} ms")
+    print(f"latency p99 {percentile(latencies, 0.99) * 1000:>9.1f} ms")
+    print(f"throughput  {len(latencies) / elapsed:>9.1f} msg/s")
+    print(f"transcript digest {digest.hexdigest()[:16]}")
+
+    ok = not failures
+    for failure in failures[:10]:
+        print(f"failed: {failure}")
+    if len(failures) > 10:
+        print(f"... and {len(failures) - 10} more failed requests")
+
+    llm_service = app_module.llm_service
+    if llm_service.replay is not None:
+        stats = llm_service.replay.stats()
+        print(f"replay hits {stats['hits']}, misses {stats['misses']} "
+              f"(recorded p50 {stats['latency_ms_p50']} ms, p95 {stats['latency_ms_p95']} ms)")
+        if args.strict and stats["misses"]:
+            print(f"strict replay: {stats['misses']} requests were missing from the recording")
+            ok = False
+    if llm_service.recorder is not None:
+        print(f"recorded {llm_service.recorder.recorded} provider calls to {llm_service.recorder.path}")
+    await app_module.shutdown_event()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["record", "replay", "mock"], default="replay")
+    parser.add_argument("--recording", default=os.path.join(ROOT, "recordings", "llm.jsonl"))
+    parser.add_argument("--provider", choices=["gemini", "openai"], default="gemini")
+    parser.add_argument("--sessions", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--strict", action="store_true", help="fail on requests missing from the recording")
+    parser.add_argument("--escalate", action="store_true", help="also request a summary per session")
+    args = parser.parse_args()
+
+    # Settings are read at import time, so configure them before importing the backend
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_replay_'), 'bench.db')}"
+    os.environ["DEBUG"] = "False"
+    os.environ["AI_PROVIDER"] = args.mode
+    os.environ["RECORDING_PROVIDER"] = args.provider
+    os.environ["RECORDING_PATH"] = os.path.abspath(args.recording)
+    os.environ["REPLAY_LATENCY_SCALE"] = str(args.latency_scale)
+    os.environ["REPLAY_STRICT"] = str(args.strict)
+    # The backend loads ../data/faqs.json relative to its own directory
+    os.chdir(os.path.join(ROOT, "backend"))
+    sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+    if not asyncio.run(run(args)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
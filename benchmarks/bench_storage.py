@@ -0,0 +1,120 @@
+"""
+Benchmark database size and read throughput for plain vs compact message storage.
+
+Usage (from the repository root):
+    python benchmarks/bench_storage.py --sessions 2000 --messages 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_storage_"), "bench.db")
+
+# Settings are read at import time, so configure them before importing the backend
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_PATH}"
+os.environ["DEBUG"] = "False"
+os.environ["MESSAGE_STORAGE_MODE"] = "plain"
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from sqlalchemy import select, text  # noqa: E402
+
+import compression  # noqa: E402
+import message_store  # noqa: E402
+from database import engine, async_session_factory, init_db, close_db  # noqa: E402
+from models import ChatSession, Message, MessageRole, SessionStatus  # noqa: E402
+
+USER_MESSAGES = [
+    "How do I reset my password?",
+    "What is your refund policy for digital products I bought last week?",
+    "My order hasn't arrived yet, can you check the tracking status?",
+    "Do you ship internationally and how long does it take?",
+    "I was charged twice for my subscription this month",
+]
+
+
+def _faq_answers():
+    with open(os.path.join(ROOT, "data", "faqs.json")) as f:
+        return [faq["answer"] for faq in json.load(f)["faqs"]]
+
+
+async def populate(sessions: int, messages: int):
+    answers = _faq_answers()
+    rng = random.Random(42)
+
+    async with async_session_factory() as db:
+        for s in range(sessions):
+            session_id = f"bench-{s:08d}"
+            db.add(ChatSession(session_id=session_id, status=SessionStatus.ACTIVE))
+            for m in range(messages // 2):
+                db.add(Message(session_id=session_id, role=MessageRole.USER,
+                               content=rng.choice(USER_MESSAGES)))
+                db.add(Message(session_id=session_id, role=MessageRole.ASSISTANT,
+                               content=rng.choice(answers), confidence_score=0.9))
+            if s % 200 == 199:
+                await db.commit()
+        await db.commit()
+
+
+async def vacuum():
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM"))
+
+
+async def read_throughput(sessions: int) -> float:
+    """Messages decoded per second when loading full transcripts"""
+    session_ids = [f"bench-{s:08d}" for s in range(sessions)]
+    decoded = 0
+    start = time.perf_counter()
+    async with async_session_factory() as db:
+        for session_id in session_ids:
+            result = await db.execute(
+                select(Message).where(Message.session_id == session_id).order_by(Message.timestamp)
+            )
+            for message in result.scalars().all():
+                decoded += len(message.content) > 0
+            db.expunge_all()
+    return decoded / (time.perf_counter() - start)
+
+
+async def measure(label: str, sessions: int) -> dict:
+    await vacuum()
+    return {
+        "mode": label,
+        "size_mb": os.path.getsize(DB_PATH) / (1024 * 1024),
+        "read_msgs_per_s": await read_throughput(sessions),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=20, help="messages per session")
+    args = parser.parse_args()
+
+    await init_db()
+    await populate(args.sessions, args.messages)
+    results = [await measure(compression.STORAGE_PLAIN, args.sessions)]
+
+    async with async_session_factory() as db:
+        await message_store.migrate(db, compression.STORAGE_COMPACT)
+    results.append(await measure(compression.STORAGE_COMPACT, args.sessions))
+
+    await close_db()
+
+    codec = "zstd" if compression.zstandard is not None else "zlib"
+    print(f"{args.sessions} sessions x {args.messages} messages (codec: {codec})")
+    print(f"{'mode':<10}{'size (MB)':>12}{'read msgs/s':>16}")
+    for row in results:
+        print(f"{row['mode']:<10}{row['size_mb']:>12.2f}{row['read_msgs_per_s']:>16.0f}")
+    print(f"size ratio: {results[1]['size_mb'] / results[0]['size_mb']:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""
+Benchmark POST /api/chat/message latency with synchronous commits vs the write-behind queue.
+
+Both runs use the mock provider, so the difference is the cost of persisting the
+user/assistant messages, the session bump and the analytics rollups on the request path.
+
+Usage (from the repository root):
+    python benchmarks/bench_write_behind.py --requests 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="bench_write_behind_")
+
+# Settings are read at import time, so configure them before importing the backend
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(WORK_DIR, 'bench.db')}"
+os.environ["DEBUG"] = "False"
+os.environ["AI_PROVIDER"] = "mock"
+os.environ["ADMISSION_ENABLED"] = "False"
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+import httpx  # noqa: E402
+from sqlalchemy import select, func  # noqa: E402
+
+import app as app_module  # noqa: E402
+from database import async_session_factory, init_db, close_db  # noqa: E402
+from models import Message  # noqa: E402
+from write_behind import WriteBehindQueue  # noqa: E402
+
+MESSAGES = ["How do I reset my password?", "What is your refund policy?", "hello", "Where is my order?"]
+
+
+async def run(client: httpx.AsyncClient, label: str, requests: int, session_length: int):
+    sessions = []
+    latencies = []
+    for i in range(requests):
+        if i % session_length == 0:
+            sessions.append((await client.post("/api/chat/create", json={})).json()["session_id"])
+        session_id = sessions[-1]
+        start = time.perf_counter()
+        response = await client.post(
+            "/api/chat/message", json={"session_id": session_id, "message": MESSAGES[i % len(MESSAGES)]}
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    latencies.sort()
+    p95 = latencies[int(0.95 * len(latencies))]
+    print(f"{label:<24}p50 {statistics.median(latencies):>7.2f} ms   p95 {p95:>7.2f} ms")
+    return sessions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--session-length", type=int, default=10, help="messages sent per session")
+    parser.add_argument("--fsync", action="store_true", help="fsync the write-behind log on every append")
+    args = parser.parse_args()
+
+    await init_db()
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await run(client, "synchronous commit", args.requests, args.session_length)
+
+        queue = WriteBehindQueue(async_session_factory, os.path.join(WORK_DIR, "write_behind.log"), fsync=args.fsync)
+        app_module.write_behind_queue = queue
+        await queue.start()
+        sessions = await run(client, "write-behind", args.requests, args.session_length)
+        await queue.stop()
+        app_module.write_behind_queue = None
+
+    async with async_session_factory() as db:
+        stored = (await db.execute(
+            select(func.count(Message.id)).where(Message.session_id.in_(sessions))
+        )).scalar()
+    assert stored == 2 * args.requests, stored
+    print(f"write-behind persisted {stored} messages in {queue.stats()['batches']} batches")
+    await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
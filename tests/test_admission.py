@@ -0,0 +1,164 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from admission import PRIORITY_HIGH, PRIORITY_NORMAL, AdmissionController, AdmissionRejected  # noqa: E402
+
+
+def make_controller(**kwargs) -> AdmissionController:
+    options = {"max_concurrent": 1, "queue_slo_seconds": 10.0, "max_queue": 100}
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+async def serve(controller, tenant, order, priority=PRIORITY_NORMAL):
+    granted_at = await controller.acquire(tenant, priority)
+    order.append(tenant)
+    controller.release(granted_at)
+
+
+async def dispatch_order(controller, holder, requests):
+    """Queue `requests` behind a held slot, free it and return the order they were served in"""
+    granted_at = await controller.acquire(holder)
+    order = []
+    tasks = [asyncio.create_task(serve(controller, tenant, order, priority)) for tenant, priority in requests]
+    # Let every task enqueue, in creation order, before the slot frees up
+    await asyncio.sleep(0)
+    assert controller.stats()["queue_depth"] == len(requests)
+    controller.release(granted_at)
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_light_tenant_is_not_stuck_behind_a_heavy_backlog():
+    controller = make_controller()
+    requests = [("heavy", PRIORITY_NORMAL)] * 4 + [("light", PRIORITY_NORMAL)] * 2
+    order = asyncio.run(dispatch_order(controller, "heavy", requests))
+    # The light tenant queued last but alternates with the heavy one instead of waiting out its backlog
+    assert order == ["light", "heavy", "light", "heavy", "heavy", "heavy"]
+
+
+def test_weights_split_dispatches_between_tenants():
+    controller = make_controller(tenant_weights={"light": 2.0})
+    requests = [("heavy", PRIORITY_NORMAL)] * 6 + [("light", PRIORITY_NORMAL)] * 3
+    order = asyncio.run(dispatch_order(controller, "heavy", requests))
+    assert order[:5] == ["light", "light", "heavy", "light", "heavy"]
+    assert order.count("heavy") == 6
+
+
+def test_high_priority_bypasses_the_queue():
+    controller = make_controller()
+    # By start tag alone tenant b goes first and a's last request goes last
+    requests = [("a", PRIORITY_NORMAL)] * 3 + [("b", PRIORITY_NORMAL), ("a", PRIORITY_HIGH)]
+    order = asyncio.run(dispatch_order(controller, "a", requests))
+    assert order == ["a", "b", "a", "a", "a"]
+
+
+def test_sheds_when_estimated_wait_exceeds_slo():
+    async def test():
+        controller = make_controller(queue_slo_seconds=1.0)
+        # A slot held for 2.5 seconds sets the service time estimate
+        controller.release(await controller.acquire("a") - 2.5)
+        granted_at = await controller.acquire("a")
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("b")
+        assert rejected.value.reason == "Estimated queue wait exceeds SLO"
+        assert rejected.value.retry_after == 3
+        stats = controller.stats()
+        assert (stats["rejected"], stats["queue_depth"], stats["in_flight"]) == (1, 0, 1)
+        controller.release(granted_at)
+
+    asyncio.run(test())
+
+
+def test_sheds_when_actual_wait_exceeds_slo():
+    async def test():
+        # No service time recorded yet, so the estimate admits the request to the queue
+        controller = make_controller(queue_slo_seconds=0.05)
+        granted_at = await controller.acquire("a")
+        started = time.monotonic()
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("b")
+        assert time.monotonic() - started >= 0.05
+        assert rejected.value.reason == "Queue wait exceeded SLO"
+        assert rejected.value.retry_after >= 1
+        stats = controller.stats()
+        assert (stats["queue_depth"], stats["queue_depth_by_tenant"], stats["in_flight"]) == (0, {}, 1)
+
+        # The timed-out waiter is skipped, not handed the freed slot
+        controller.release(granted_at)
+        assert controller.stats()["in_flight"] == 0
+
+    asyncio.run(test())
+
+
+def test_sheds_when_queue_is_full():
+    async def test():
+        controller = make_controller(max_queue=1)
+        granted_at = await controller.acquire("a")
+        queued = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("c")
+        assert rejected.value.reason == "Admission queue is full"
+        assert rejected.value.retry_after >= 1
+
+        controller.release(granted_at)
+        controller.release(await queued)
+        assert controller.stats()["in_flight"] == 0
+
+    asyncio.run(test())
+
+
+def test_cancelled_waiter_releases_its_queue_entry():
+    async def test():
+        controller = make_controller()
+        granted_at = await controller.acquire("a")
+        cancelled = asyncio.create_task(controller.acquire("b"))
+        waiting = asyncio.create_task(controller.acquire("c"))
+        await asyncio.sleep(0)
+        assert controller.stats()["queue_depth_by_tenant"] == {"b": 1, "c": 1}
+
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        stats = controller.stats()
+        assert (stats["queue_depth"], stats["queue_depth_by_tenant"], stats["in_flight"]) == (1, {"c": 1}, 1)
+
+        # The freed slot skips the cancelled entry and goes to the next waiter
+        controller.release(granted_at)
+        controller.release(await waiting)
+        stats = controller.stats()
+        assert (stats["queue_depth"], stats["in_flight"], stats["admitted"]) == (0, 0, 2)
+
+    asyncio.run(test())
+
+
+def test_waiter_cancelled_after_its_slot_was_granted_hands_it_back():
+    async def test():
+        controller = make_controller()
+        granted_at = await controller.acquire("a")
+        cancelled = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+
+        # The slot is granted, but the waiter is cancelled before it resumes
+        controller.release(granted_at)
+        assert controller.stats()["in_flight"] == 1
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        stats = controller.stats()
+        assert (stats["queue_depth"], stats["in_flight"]) == (0, 0)
+
+        # The returned slot is usable straight away
+        controller.release(await controller.acquire("c"))
+
+    asyncio.run(test())
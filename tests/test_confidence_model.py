@@ -0,0 +1,64 @@
+import itertools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from confidence_model import ConfidenceScorer, HeuristicScorer, extract_features, extract_features_batch  # noqa: E402
+
+MATCH_THRESHOLD = 0.6
+ESCALATION_THRESHOLD = 0.7
+
+LONG_REPLY = "You can reset your password from the login page by following the emailed link."
+SHORT_REPLY = "Use the reset link."
+
+
+def original_heuristic(response: str, faq_match: str) -> float:
+    """The rule set the scorer replaced, copied verbatim"""
+    confidence = 0.8
+    if faq_match:
+        confidence = 0.95
+    uncertainty_phrases = [
+        "i'm not sure", "i don't know", "uncertain",
+        "might be", "possibly", "perhaps", "maybe"
+    ]
+    if any(phrase in response.lower() for phrase in uncertainty_phrases):
+        confidence -= 0.3
+    if len(response.split()) < 10:
+        confidence -= 0.1
+    return max(0.0, min(1.0, confidence))
+
+
+def make_response(hedging: bool, short: bool) -> str:
+    response = SHORT_REPLY if short else LONG_REPLY
+    return ("Maybe " + response) if hedging else response
+
+
+@pytest.mark.parametrize("faq_match,hedging,short", list(itertools.product([False, True], repeat=3)))
+def test_fallback_reproduces_original_heuristic(faq_match, hedging, short):
+    response = make_response(hedging, short)
+    retrieval_score = 0.9 if faq_match else 0.2
+    expected = original_heuristic(response, "answer" if faq_match else "")
+
+    scorer = HeuristicScorer()
+    features = extract_features(response, retrieval_score, [], MATCH_THRESHOLD)
+    assert scorer.score(features) == expected
+    assert (scorer.score(features) < ESCALATION_THRESHOLD) == (expected < ESCALATION_THRESHOLD)
+
+    batch = extract_features_batch([response], [retrieval_score], [0], [0.0], MATCH_THRESHOLD)
+    assert scorer.score_batch(batch)[0] == expected
+
+
+def test_missing_model_file_falls_back_to_heuristic(tmp_path):
+    assert isinstance(ConfidenceScorer.load(str(tmp_path / "missing.json")), HeuristicScorer)
+
+
+def test_batch_features_match_single():
+    responses = [LONG_REPLY, "Perhaps " + SHORT_REPLY, "x" * 20000, ""]
+    scores = [0.9, 0.1, 0.0, 0.65]
+    batch = extract_features_batch(responses, scores, [0, 3, 1, 0], [0.0] * 4, MATCH_THRESHOLD)
+    for row, (response, score) in zip(batch, zip(responses, scores)):
+        single = extract_features(response, score, [], MATCH_THRESHOLD)
+        assert row[:5].tolist() == pytest.approx(single[:5])
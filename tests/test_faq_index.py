@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "backend")
+sys.path.insert(0, BACKEND)
+# Settings are read at import time; keep provider setup offline
+os.environ.setdefault("AI_PROVIDER", "mock")
+
+import faq_index  # noqa: E402
+from faq_index import FAQIndex, HashingEmbedder, build_embedder  # noqa: E402
+
+# Defaults of FAQ_MIN_SIMILARITY and FAQ_MATCH_THRESHOLD in config.py
+MIN_SIMILARITY = 0.6
+MATCH_THRESHOLD = 0.7
+
+# Paraphrases the synonym table is meant to cover (they guard the table, not generalization)
+PARAPHRASES = [
+    ("I'm locked out of my account", "How do I reset my password?"),
+    ("I forgot my login details", "How do I reset my password?"),
+    ("I want my money back", "What is your refund policy?"),
+    ("when will my parcel arrive", "How do I track my order?"),
+    ("when are you open", "What are your customer support hours?"),
+    ("the app keeps crashing", "Do you offer technical support?"),
+    ("how do I talk to a real person", "How do I contact a human agent?"),
+    ("do you take credit cards", "What payment methods do you accept?"),
+]
+
+# Off-topic questions sharing an everyday word with some FAQ; none were used to tune the table
+UNRELATED = [
+    "what time is it",
+    "I need to recover deleted files",
+    "my phone screen is cracked",
+    "is the product safe for kids",
+    "I can't open the app",
+    "my data plan ran out",
+    "I want to order a pizza",
+    "how do I stop the timer",
+    "is the store open late",
+    "what is the weather today",
+    "tell me a joke",
+]
+
+
+def load_faqs():
+    with open(os.path.join(ROOT, "data", "faqs.json"), "r") as f:
+        return json.load(f)["faqs"]
+
+
+@pytest.fixture(scope="module")
+def index():
+    faqs = [
+        SimpleNamespace(question=faq["question"], answer=faq["answer"], keywords=tuple(faq["keywords"]))
+        for faq in load_faqs()
+    ]
+    return FAQIndex(faqs, HashingEmbedder(1024))
+
+
+@pytest.fixture
+def service(monkeypatch):
+    def unavailable(model_name):
+        raise ImportError("sentence_transformers")
+
+    # Force the hashing fallback even where sentence-transformers is installed
+    monkeypatch.setattr(faq_index, "SentenceTransformerEmbedder", unavailable)
+    # The service loads ../data/faqs.json relative to the backend directory
+    monkeypatch.chdir(BACKEND)
+    from llm_service import LLMService
+    return LLMService()
+
+
+@pytest.mark.parametrize("query,question", PARAPHRASES)
+def test_hashing_fallback_ranks_paraphrases(index, query, question):
+    position, score = index.search(query)[0]
+    assert index.faqs[position].question == question
+    assert score >= MIN_SIMILARITY
+
+
+@pytest.mark.parametrize("query", UNRELATED)
+def test_hashing_fallback_rejects_unrelated_queries(index, query):
+    _, score = index.search(query)[0]
+    assert score < MIN_SIMILARITY
+
+
+@pytest.mark.parametrize("query", [query for query, _ in PARAPHRASES] + UNRELATED)
+def test_hashing_scores_never_make_a_confident_match_alone(service, query):
+    matches = service._search_faq(query)
+    keyword_hit = bool(matches) and any(keyword in query.lower() for keyword in matches[0][0].keywords_lower)
+    if not keyword_hit:
+        assert service._best_faq_answer(matches) is None
+
+
+def test_keyword_hit_is_a_confident_match(service):
+    matches = service._search_faq("How do I reset my password?")
+    assert matches[0][0].question == "How do I reset my password?"
+    assert service._best_faq_answer(matches) == matches[0][0].answer
+
+
+@pytest.mark.parametrize("query", ["what time is it", "I need to recover deleted files"])
+def test_mock_reply_does_not_use_unrelated_faq_answers(service, query):
+    response, _, _ = asyncio.run(service.generate_response(query, []))
+    assert response not in {faq["answer"] for faq in load_faqs()}
+
+
+def test_batch_search_matches_single(index):
+    queries = [query for query, _ in PARAPHRASES] + UNRELATED
+    for batched, query in zip(index.search_batch(queries), queries):
+        single = index.search(query)
+        assert [position for position, _ in batched] == [position for position, _ in single]
+        assert [score for _, score in batched] == pytest.approx([score for _, score in single], abs=1e-5)
+
+
+def test_build_embedder_falls_back_to_hashing(monkeypatch):
+    def unavailable(model_name):
+        raise ImportError("sentence_transformers")
+
+    monkeypatch.setattr(faq_index, "SentenceTransformerEmbedder", unavailable)
+    assert isinstance(build_embedder("all-MiniLM-L6-v2", 1024), HashingEmbedder)
+    assert isinstance(build_embedder("", 1024), HashingEmbedder)
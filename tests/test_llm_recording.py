@@ -0,0 +1,48 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from llm_recording import RecordingWriter, ReplayContextMismatch, ReplayMiss, ReplayProvider  # noqa: E402
+
+CONTEXT = {"faq_embedder": "hashing/1024/0d3e54a6", "faq_digest": "dc7a5587fe021fe8"}
+OTHER_CONTEXT = {"faq_embedder": "sentence-transformers/all-MiniLM-L6-v2", "faq_digest": "dc7a5587fe021fe8"}
+
+
+def record(tmp_path, context):
+    path = str(tmp_path / "recording.jsonl")
+    writer = RecordingWriter(path, context)
+    writer.append("gemini", "gemini-pro", "How do I reset my password? (relevance 0.65)", "Use the reset link.", 0.1)
+    writer.close()
+    return path
+
+
+def test_entries_store_the_recording_context(tmp_path):
+    with open(record(tmp_path, CONTEXT), "r", encoding="utf-8") as f:
+        assert json.loads(f.readline())["context"] == CONTEXT
+
+
+def test_matching_context_replays(tmp_path, capsys):
+    replay = ReplayProvider.load(record(tmp_path, CONTEXT), latency_scale=0, strict=True, context=CONTEXT)
+    assert replay.serve("gemini", "How do I reset my password? (relevance 0.65)") == ("Use the reset link.", 0.0)
+    with pytest.raises(ReplayMiss):
+        replay.serve("gemini", "How do I reset my password? (relevance 0.70)")
+    assert "[WARNING]" not in capsys.readouterr().out
+
+
+def test_context_mismatch_warns(tmp_path, capsys):
+    ReplayProvider.load(record(tmp_path, CONTEXT), context=OTHER_CONTEXT)
+    assert "1 of 1 recorded responses were made with FAQ setup" in capsys.readouterr().out
+
+
+def test_context_mismatch_fails_strict_replay(tmp_path):
+    with pytest.raises(ReplayContextMismatch):
+        ReplayProvider.load(record(tmp_path, CONTEXT), strict=True, context=OTHER_CONTEXT)
+
+
+def test_untagged_recordings_warn(tmp_path, capsys):
+    ReplayProvider.load(record(tmp_path, None), strict=True, context=CONTEXT)
+    assert "have no FAQ setup to check" in capsys.readouterr().out
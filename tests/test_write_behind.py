@@ -0,0 +1,191 @@
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from sqlalchemy import delete, func, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine  # noqa: E402
+
+import message_store  # noqa: E402
+from models import Base, ChatSession, Message, MessageRole  # noqa: E402
+from write_behind import PendingMessage, WriteBehindQueue, merge_transcript  # noqa: E402
+
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def run(test, tmp_path):
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with factory() as db:
+            db.add_all([ChatSession(session_id="s1"), ChatSession(session_id="s2")])
+            await db.commit()
+        try:
+            await test(factory, str(tmp_path / "write_behind.log"))
+        finally:
+            await engine.dispose()
+
+    asyncio.run(main())
+
+
+def make_queue(factory, log_path, **kwargs) -> WriteBehindQueue:
+    # A long interval keeps the background flusher out of the way; tests flush explicitly
+    return WriteBehindQueue(factory, log_path, flush_interval=60, **kwargs)
+
+
+def messages(count, offset=0):
+    return [
+        (MessageRole.USER, f"message {offset + i}", None, START + timedelta(seconds=offset + i))
+        for i in range(count)
+    ]
+
+
+def crash(queue):
+    """Drop a queue the way a killed process would: no final flush, no log rewrite"""
+    queue._task.cancel()
+    queue._log.close()
+    queue._release_log_lock()
+
+
+async def stored_contents(factory, session_id="s1"):
+    async with factory() as db:
+        return [content for _, content, _, _ in await message_store.fetch_transcript(db, session_id)]
+
+
+def test_replay_after_crash_inserts_each_entry_once(tmp_path):
+    async def test(factory, log_path):
+        queue = make_queue(factory, log_path, batch_size=2)
+        await queue.start()
+        await queue.append("s1", messages(5))
+        # Commits the first batch and advances the checkpoint to sequence 2
+        assert await queue.flush() == 2
+        crash(queue)
+
+        # The log still holds all five entries; those at or below the checkpoint are skipped
+        assert len(open(log_path, "rb").readlines()) == 5
+        restarted = make_queue(factory, log_path, batch_size=2)
+        await restarted.start()
+        assert restarted.stats()["pending"] == 3
+        await restarted.stop()
+
+        assert await stored_contents(factory) == [f"message {i}" for i in range(5)]
+        assert os.path.getsize(log_path) == 0
+
+    run(test, tmp_path)
+
+
+def test_flush_that_empties_the_buffer_truncates_the_log(tmp_path):
+    async def test(factory, log_path):
+        queue = make_queue(factory, log_path)
+        await queue.start()
+        await queue.append("s1", messages(3))
+        assert os.path.getsize(log_path) > 0
+        await queue.flush()
+        assert os.path.getsize(log_path) == 0
+        await queue.append("s1", messages(1, offset=3))
+        assert len(open(log_path, "rb").readlines()) == 1
+        await queue.stop()
+        assert await stored_contents(factory) == [f"message {i}" for i in range(4)]
+
+    run(test, tmp_path)
+
+
+def test_compaction_keeps_only_pending_entries(tmp_path):
+    async def test(factory, log_path):
+        queue = make_queue(factory, log_path, batch_size=2, compact_bytes=1)
+        await queue.start()
+        await queue.append("s1", messages(5))
+        await queue.flush()
+        lines = open(log_path, "rb").readlines()
+        assert [PendingMessage.from_log(line).sequence for line in lines] == [3, 4, 5]
+        await queue.append("s1", messages(1, offset=5))
+        assert len(open(log_path, "rb").readlines()) == 4
+        await queue.stop()
+        assert len(await stored_contents(factory)) == 6
+
+    run(test, tmp_path)
+
+
+def test_discard_drops_queued_messages(tmp_path):
+    async def test(factory, log_path):
+        queue = make_queue(factory, log_path)
+        await queue.start()
+        await queue.append("s1", messages(2))
+        await queue.append("s2", messages(3, offset=2))
+        pending_bytes = queue.pending_bytes
+
+        queue.discard("s2")
+        assert queue.snapshot("s2") == []
+        assert len(queue.snapshot("s1")) == 2
+        assert 0 < queue.pending_bytes < pending_bytes
+        await queue.stop()
+
+        assert await stored_contents(factory, "s1") == ["message 0", "message 1"]
+        assert await stored_contents(factory, "s2") == []
+
+    run(test, tmp_path)
+
+
+def test_paused_queue_does_not_flush_into_a_deleted_session(tmp_path):
+    async def test(factory, log_path):
+        queue = make_queue(factory, log_path)
+        await queue.start()
+        await queue.append("s2", messages(3))
+
+        async with queue.paused():
+            flush = asyncio.create_task(queue.flush())
+            await asyncio.sleep(0.05)
+            assert not flush.done()
+            queue.discard("s2")
+            async with factory() as db:
+                await db.execute(delete(ChatSession).where(ChatSession.session_id == "s2"))
+                await db.commit()
+        assert await flush == 0
+        await queue.stop()
+
+        async with factory() as db:
+            assert (await db.execute(select(func.count(Message.id)))).scalar() == 0
+
+    run(test, tmp_path)
+
+
+def test_workers_sharing_a_path_claim_separate_slots(tmp_path):
+    async def test(factory, log_path):
+        first = make_queue(factory, log_path)
+        second = make_queue(factory, log_path)
+        await first.start()
+        await second.start()
+        assert first.log_path == log_path
+        assert second.log_path == str(tmp_path / "write_behind.1.log")
+
+        await second.append("s2", messages(2))
+        crash(second)
+        await first.stop()
+
+        # A later start flushes the slot no running worker holds
+        restarted = make_queue(factory, log_path)
+        await restarted.start()
+        assert restarted.log_path == log_path
+        assert await stored_contents(factory, "s2") == ["message 0", "message 1"]
+        await restarted.stop()
+
+    run(test, tmp_path)
+
+
+def test_merge_transcript_skips_rows_flushed_after_the_snapshot():
+    pending = [
+        PendingMessage(1, "s1", MessageRole.USER, "question", None, START),
+        PendingMessage(2, "s1", MessageRole.ASSISTANT, "answer", 0.9, START + timedelta(seconds=1)),
+    ]
+    # The flusher committed the user message between the snapshot and the query
+    stored = [(MessageRole.USER, "question", None, START)]
+    merged = merge_transcript(stored, pending)
+    assert merged == [
+        (MessageRole.USER, "question", None, START),
+        (MessageRole.ASSISTANT, "answer", 0.9, START + timedelta(seconds=1)),
+    ]
+    assert merge_transcript(stored, []) is stored